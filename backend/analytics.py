@@ -0,0 +1,258 @@
+import asyncio
+import math
+from datetime import date, timedelta
+
+from pymongo import DESCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+BUY_FIELDS = ("invested", "tokens", "buys")
+
+
+def _bond_totals(transactions: list, sign: int) -> dict:
+    bonds = {}
+    for txn in transactions:
+        total = bonds.setdefault(txn["bond_id"], {"country": txn["bond_country"], "invested": 0, "tokens": 0, "buys": 0})
+        total["invested"] += sign * txn["amount"]
+        total["tokens"] += sign * txn["tokens_received"]
+        total["buys"] += sign
+    return bonds
+
+
+def _day_totals(transactions: list, sign: int) -> tuple:
+    """Per-day totals, and per (day, bond_id) amounts kept apart so bond ids never become field names."""
+    days = {}
+    bond_days = {}
+    for txn in transactions:
+        day = days.setdefault(txn["timestamp"][:10], {"amount": 0, "buys": 0})
+        day["amount"] += sign * txn["amount"]
+        day["buys"] += sign
+        key = (txn["timestamp"][:10], txn["bond_id"])
+        bond_days[key] = bond_days.get(key, 0) + sign * txn["amount"]
+    return days, bond_days
+
+
+def _holder_counts(pairs: list) -> dict:
+    per_bond = {}
+    for _, bond_id in pairs:
+        per_bond[bond_id] = per_bond.get(bond_id, 0) + 1
+    return per_bond
+
+
+async def record_buys(db, transactions: list, sign: int = 1, session=None):
+    """$inc the per-bond, per-day and per-bond-day counters for a set of buys; sign=-1 reverts them."""
+    bond_ops = [
+        UpdateOne(
+            {"_id": bond_id},
+            # $set rather than $setOnInsert: record_holders may have created the document first
+            {"$inc": {field: total[field] for field in BUY_FIELDS}, "$set": {"country": total["country"]}},
+            upsert=True
+        )
+        for bond_id, total in _bond_totals(transactions, sign).items()
+    ]
+    days, bond_days = _day_totals(transactions, sign)
+    day_ops = [UpdateOne({"_id": day}, {"$inc": totals}, upsert=True) for day, totals in days.items()]
+    bond_day_ops = [
+        UpdateOne({"day": day, "bond_id": bond_id}, {"$inc": {"amount": amount}}, upsert=True)
+        for (day, bond_id), amount in bond_days.items()
+    ]
+    writes = [
+        db.bond_stats.bulk_write(bond_ops, ordered=False, session=session),
+        db.daily_stats.bulk_write(day_ops, ordered=False, session=session),
+        db.daily_bond_stats.bulk_write(bond_day_ops, ordered=False, session=session),
+    ]
+    if session is None:
+        await asyncio.gather(*writes)
+    else:
+        # A session cannot run operations concurrently
+        for write in writes:
+            await write
+
+
+async def record_holders(db, new_holdings: list, session=None):
+    """Count first-time holders per bond and platform-wide from the holdings a buy created."""
+    if not new_holdings:
+        return
+    await db.bond_stats.bulk_write(
+        [
+            UpdateOne({"_id": bond_id}, {"$inc": {"holders": count}}, upsert=True)
+            for bond_id, count in _holder_counts(new_holdings).items()
+        ],
+        ordered=False,
+        session=session
+    )
+    try:
+        await db.holders.insert_many(
+            [{"_id": email} for email in {email for email, _ in new_holdings}], ordered=False, session=session
+        )
+    except BulkWriteError as exc:
+        if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+            raise
+
+
+async def revert_holders(db, removed_holdings: list, session=None):
+    """Undo record_holders for holdings a failed buy created and that were since removed."""
+    if not removed_holdings:
+        return
+    await db.bond_stats.bulk_write(
+        [
+            UpdateOne({"_id": bond_id}, {"$inc": {"holders": -count}})
+            for bond_id, count in _holder_counts(removed_holdings).items()
+        ],
+        ordered=False,
+        session=session
+    )
+    emails = {email for email, _ in removed_holdings}
+    still_holding = await db.holdings.distinct(
+        "email", {"email": {"$in": list(emails)}, "tokens": {"$gt": 0}}, session=session
+    )
+    await db.holders.delete_many({"_id": {"$in": list(emails - set(still_holding))}}, session=session)
+
+
+async def aum(db) -> dict:
+    bonds = await db.bond_stats.find({}).sort("invested", DESCENDING).to_list(None)
+    countries = {}
+    for bond in bonds:
+        country = countries.setdefault(bond.get("country"), {"country": bond.get("country"), "invested": 0, "tokens": 0})
+        country["invested"] += bond.get("invested", 0)
+        country["tokens"] += bond.get("tokens", 0)
+    return {
+        "total_invested": round(sum(bond.get("invested", 0) for bond in bonds), 2),
+        "total_tokens": round(sum(bond.get("tokens", 0) for bond in bonds), 2),
+        "by_bond": [
+            {
+                "bond_id": bond["_id"],
+                "country": bond.get("country"),
+                "invested": round(bond.get("invested", 0), 2),
+                "tokens": round(bond.get("tokens", 0), 2),
+                "buys": bond.get("buys", 0),
+                "holders": bond.get("holders", 0)
+            }
+            for bond in bonds
+        ],
+        "by_country": sorted(
+            ({**row, "invested": round(row["invested"], 2), "tokens": round(row["tokens"], 2)} for row in countries.values()),
+            key=lambda row: row["invested"],
+            reverse=True
+        )
+    }
+
+
+async def daily_volume(db, days: int, today: date) -> list:
+    start, end = (today - timedelta(days=days - 1)).isoformat(), today.isoformat()
+    rows, bond_rows = await asyncio.gather(
+        db.daily_stats.find({"_id": {"$gte": start, "$lte": end}}).sort("_id", 1).to_list(None),
+        db.daily_bond_stats.find({"day": {"$gte": start, "$lte": end}}, {"_id": 0}).to_list(None),
+    )
+    by_day = {}
+    for row in bond_rows:
+        by_day.setdefault(row["day"], {})[row["bond_id"]] = round(row.get("amount", 0), 2)
+    return [
+        {
+            "date": row["_id"],
+            "amount": round(row.get("amount", 0), 2),
+            "buys": row.get("buys", 0),
+            "by_bond": by_day.get(row["_id"], {})
+        }
+        for row in rows
+    ]
+
+
+async def holders(db) -> dict:
+    bonds = await db.bond_stats.find({}, {"_id": 1, "holders": 1}).to_list(None)
+    return {
+        "unique_holders": await db.holders.estimated_document_count(),
+        "by_bond": {bond["_id"]: bond.get("holders", 0) for bond in bonds}
+    }
+
+
+def _differs(stored, expected) -> bool:
+    return not math.isclose(stored or 0, expected or 0, rel_tol=1e-9, abs_tol=1e-6)
+
+
+async def reconcile(db, fix: bool = False) -> list:
+    """Recompute every counter with aggregation pipelines and report (or with fix, repair) drift."""
+    expected_bonds = {
+        row["_id"]: row
+        async for row in db.transactions.aggregate([
+            {"$match": {"transaction_type": "buy"}},
+            {"$group": {
+                "_id": "$bond_id",
+                "country": {"$first": "$bond_country"},
+                "invested": {"$sum": "$amount"},
+                "tokens": {"$sum": "$tokens_received"},
+                "buys": {"$sum": 1}
+            }}
+        ], allowDiskUse=True)
+    }
+    async for row in db.holdings.aggregate([
+        {"$match": {"tokens": {"$gt": 0}}},
+        {"$group": {"_id": "$bond_id", "holders": {"$sum": 1}}}
+    ]):
+        expected_bonds.setdefault(row["_id"], {"_id": row["_id"], "country": None})["holders"] = row["holders"]
+
+    expected_days = {}
+    expected_bond_days = {}
+    async for row in db.transactions.aggregate([
+        {"$match": {"transaction_type": "buy"}},
+        {"$group": {
+            "_id": {"day": {"$substr": ["$timestamp", 0, 10]}, "bond_id": "$bond_id"},
+            "amount": {"$sum": "$amount"},
+            "buys": {"$sum": 1}
+        }}
+    ], allowDiskUse=True):
+        day = expected_days.setdefault(row["_id"]["day"], {"_id": row["_id"]["day"], "amount": 0, "buys": 0})
+        day["amount"] += row["amount"]
+        day["buys"] += row["buys"]
+        expected_bond_days[(row["_id"]["day"], row["_id"]["bond_id"])] = row["amount"]
+
+    expected_holders = set(await db.holdings.distinct("email", {"tokens": {"$gt": 0}}))
+
+    drift = []
+    stored_bonds = {row["_id"]: row async for row in db.bond_stats.find({})}
+    for bond_id in sorted(set(expected_bonds) | set(stored_bonds)):
+        expected, stored = expected_bonds.get(bond_id, {}), stored_bonds.get(bond_id, {})
+        for field in BUY_FIELDS + ("holders",):
+            if _differs(stored.get(field), expected.get(field)):
+                drift.append(f"bond {bond_id} {field}: counter {stored.get(field, 0)}, recomputed {expected.get(field, 0)}")
+    stored_days = {row["_id"]: row async for row in db.daily_stats.find({})}
+    for day in sorted(set(expected_days) | set(stored_days)):
+        expected, stored = expected_days.get(day, {}), stored_days.get(day, {})
+        for field in ("amount", "buys"):
+            if _differs(stored.get(field), expected.get(field)):
+                drift.append(f"day {day} {field}: counter {stored.get(field, 0)}, recomputed {expected.get(field, 0)}")
+    stored_bond_days = {(row["day"], row["bond_id"]): row.get("amount") async for row in db.daily_bond_stats.find({})}
+    for day, bond_id in sorted(set(expected_bond_days) | set(stored_bond_days)):
+        stored, expected = stored_bond_days.get((day, bond_id)), expected_bond_days.get((day, bond_id))
+        if _differs(stored, expected):
+            drift.append(f"day {day} bond {bond_id} amount: counter {stored or 0}, recomputed {expected or 0}")
+    stored_holders = set(await db.holders.distinct("_id"))
+    if stored_holders != expected_holders:
+        drift.append(f"unique holders: counter {len(stored_holders)}, recomputed {len(expected_holders)}")
+
+    if fix and drift:
+        if expected_bonds:
+            await db.bond_stats.bulk_write([
+                ReplaceOne(
+                    {"_id": bond_id},
+                    {"country": row.get("country"), **{field: row.get(field, 0) for field in BUY_FIELDS + ("holders",)}},
+                    upsert=True
+                )
+                for bond_id, row in expected_bonds.items()
+            ], ordered=False)
+        await db.bond_stats.delete_many({"_id": {"$nin": list(expected_bonds)}})
+        if expected_days:
+            await db.daily_stats.bulk_write(
+                [ReplaceOne({"_id": day}, row, upsert=True) for day, row in expected_days.items()], ordered=False
+            )
+        await db.daily_stats.delete_many({"_id": {"$nin": list(expected_days)}})
+        await db.daily_bond_stats.delete_many({})
+        if expected_bond_days:
+            await db.daily_bond_stats.insert_many(
+                [{"day": day, "bond_id": bond_id, "amount": amount} for (day, bond_id), amount in expected_bond_days.items()],
+                ordered=False
+            )
+        missing = expected_holders - stored_holders
+        if missing:
+            await db.holders.insert_many([{"_id": email} for email in missing], ordered=False)
+        await db.holders.delete_many({"_id": {"$in": list(stored_holders - expected_holders)}})
+    return drift
@@ -0,0 +1,148 @@
+import codecs
+import csv
+import json
+import time
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(name: str) -> str:
+    return "csv" if name.lower().endswith(".csv") else "jsonl"
+
+
+async def iter_file_lines(path: str, chunk_size: int = 1 << 16):
+    with open(path, "rb") as handle:
+        async for line in iter_lines(_read_chunks(handle, chunk_size)):
+            yield line
+
+
+async def _read_chunks(handle, chunk_size: int):
+    while True:
+        chunk = handle.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def iter_lines(chunks):
+    """Split a stream of byte chunks into decoded lines, holding at most one partial line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def parse_rows(lines, fmt: str):
+    """Yield (line number, row dict or None, parse error or None) for every non-blank line.
+
+    CSV input takes its field names from the first line; quoted fields may not span lines.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown bond file format: {fmt}")
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if fmt == "jsonl":
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_no, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield line_no, None, "Expected a JSON object"
+                continue
+            yield line_no, row, None
+            continue
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, None, f"Expected {len(header)} columns, found {len(values)}"
+            continue
+        yield line_no, {name: value for name, value in zip(header, values) if value != ""}, None
+
+
+def validation_detail(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+    )
+
+
+class BondIngest:
+    """Validates bond rows against the model and upserts them by id in batched bulk writes.
+
+    run() is an async generator of events: one "error" per rejected row, a "progress"
+    after every batch and a final "summary". Only the current batch is held in memory,
+    so memory use does not grow with the size of the input.
+    """
+
+    def __init__(self, db, model, batch_size: int = 500):
+        self.db = db
+        self.model = model
+        self.batch_size = batch_size
+        self.stats = {"rows": 0, "valid": 0, "upserted": 0, "modified": 0, "unchanged": 0, "errors": 0}
+        self._started = None
+
+    def _progress(self, kind: str) -> dict:
+        elapsed = time.monotonic() - self._started
+        return {
+            "type": kind,
+            **self.stats,
+            "elapsed": round(elapsed, 3),
+            "rows_per_second": round(self.stats["rows"] / elapsed, 1) if elapsed else None
+        }
+
+    async def _write(self, batch: list) -> list:
+        ops = [UpdateOne({"id": doc["id"]}, {"$set": doc}, upsert=True) for _, doc in batch]
+        failures = []
+        try:
+            result = (await self.db.bonds.bulk_write(ops, ordered=False)).bulk_api_result
+        except BulkWriteError as exc:
+            result = exc.details
+            for error in result["writeErrors"]:
+                line_no, doc = batch[error["index"]]
+                failures.append({"type": "error", "line": line_no, "id": doc["id"], "detail": error["errmsg"]})
+        self.stats["upserted"] += result["nUpserted"]
+        self.stats["modified"] += result["nModified"]
+        self.stats["unchanged"] += result["nMatched"] - result["nModified"]
+        self.stats["valid"] -= len(failures)
+        self.stats["errors"] += len(failures)
+        return failures
+
+    async def run(self, rows):
+        self._started = time.monotonic()
+        batch = []
+        async for line_no, row, error in rows:
+            self.stats["rows"] += 1
+            if error is None:
+                try:
+                    batch.append((line_no, self.model(**row).model_dump()))
+                    self.stats["valid"] += 1
+                except ValidationError as exc:
+                    error = validation_detail(exc)
+            if error is not None:
+                self.stats["errors"] += 1
+                yield {"type": "error", "line": line_no, "id": (row or {}).get("id"), "detail": error}
+            if len(batch) >= self.batch_size:
+                for failure in await self._write(batch):
+                    yield failure
+                batch = []
+                yield self._progress("progress")
+        if batch:
+            for failure in await self._write(batch):
+                yield failure
+        yield self._progress("summary")
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from indexes import apply_indexes, manifest_hash
+
+logger = logging.getLogger(__name__)
+
+# Bump when the seed steps change so running deployments re-apply them once; index
+# changes are picked up from the manifest hash without a bump
+BOOTSTRAP_VERSION = 1
+
+SEED_BONDS = [
+    {
+        "id": "bond_us_1",
+        "country": "United States",
+        "country_code": "US",
+        "yield_percentage": 4.2,
+        "maturity_date": "2028-12-31",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/us.png",
+        "description": "US Treasury bonds backed by the full faith of the United States government.",
+        "issuer": "U.S. Department of Treasury"
+    },
+    {
+        "id": "bond_sg_1",
+        "country": "Singapore",
+        "country_code": "SG",
+        "yield_percentage": 3.8,
+        "maturity_date": "2029-06-30",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/sg.png",
+        "description": "Singapore Government Securities with AAA credit rating.",
+        "issuer": "Monetary Authority of Singapore"
+    },
+    {
+        "id": "bond_de_1",
+        "country": "Germany",
+        "country_code": "DE",
+        "yield_percentage": 2.9,
+        "maturity_date": "2030-03-15",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/de.png",
+        "description": "German Bundesanleihen, considered one of the safest investments in Europe.",
+        "issuer": "Federal Republic of Germany"
+    },
+    {
+        "id": "bond_jp_1",
+        "country": "Japan",
+        "country_code": "JP",
+        "yield_percentage": 1.5,
+        "maturity_date": "2027-09-30",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/jp.png",
+        "description": "Japanese Government Bonds (JGBs) known for stability.",
+        "issuer": "Ministry of Finance Japan"
+    },
+    {
+        "id": "bond_ca_1",
+        "country": "Canada",
+        "country_code": "CA",
+        "yield_percentage": 3.5,
+        "maturity_date": "2029-11-15",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/ca.png",
+        "description": "Government of Canada bonds with strong credit rating.",
+        "issuer": "Government of Canada"
+    },
+    {
+        "id": "bond_au_1",
+        "country": "Australia",
+        "country_code": "AU",
+        "yield_percentage": 4.0,
+        "maturity_date": "2028-08-31",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/au.png",
+        "description": "Australian Government Bonds with attractive yields.",
+        "issuer": "Australian Office of Financial Management"
+    },
+    {
+        "id": "bond_uk_1",
+        "country": "United Kingdom",
+        "country_code": "GB",
+        "yield_percentage": 4.5,
+        "maturity_date": "2029-04-30",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/gb.png",
+        "description": "UK Gilts issued by Her Majesty's Treasury.",
+        "issuer": "UK Debt Management Office"
+    },
+    {
+        "id": "bond_ch_1",
+        "country": "Switzerland",
+        "country_code": "CH",
+        "yield_percentage": 1.8,
+        "maturity_date": "2030-12-31",
+        "minimum_entry": 1.0,
+        "flag_url": "https://flagcdn.com/w80/ch.png",
+        "description": "Swiss Confederation bonds, ultra-safe haven assets.",
+        "issuer": "Swiss Federal Finance Administration"
+    }
+]
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def acquire_lease(db, name: str, holder: str, ttl: float) -> bool:
+    """Take or renew a named lease; False while another holder's lease is unexpired."""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.locks.find_one_and_update(
+            {"_id": name, "$or": [{"holder": holder}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=ttl)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def release_lease(db, name: str, holder: str):
+    await db.locks.delete_one({"_id": name, "holder": holder})
+
+
+async def seed_bonds(db, bonds: list = SEED_BONDS) -> int:
+    """Insert any seed bond that is missing; existing documents are left untouched."""
+    ops = [UpdateOne({"id": bond["id"]}, {"$setOnInsert": bond}, upsert=True) for bond in bonds]
+    try:
+        result = await db.bonds.bulk_write(ops, ordered=False)
+    except BulkWriteError as exc:
+        # Two upserts of the same id can race past the unique index; the loser is a no-op
+        if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+            raise
+        return exc.details["nUpserted"]
+    return result.upserted_count
+
+
+async def bootstrap_state(db) -> dict:
+    return await db.meta.find_one({"_id": "bootstrap"}) or {}
+
+
+def _seeded(state: dict) -> bool:
+    return state.get("version", 0) >= BOOTSTRAP_VERSION
+
+
+def _indexed(state: dict) -> bool:
+    return state.get("indexes") == manifest_hash()
+
+
+async def bootstrapped(db) -> bool:
+    state = await bootstrap_state(db)
+    return _seeded(state) and _indexed(state)
+
+
+async def bootstrap(db, holder: str = None, ttl: float = 60.0, wait: float = 60.0) -> bool:
+    """Apply indexes and seed data across any number of workers.
+
+    Indexes are applied whenever the index manifest's hash differs from the one
+    recorded at the last bootstrap; seed data once per BOOTSTRAP_VERSION. One
+    worker takes the bootstrap lease and does the work; the rest wait for it to
+    finish rather than racing it. Returns True if this call did the work. Set
+    SEED_DEMO_BONDS=false when the catalog is loaded with `manage.py import-bonds`.
+    """
+    if await bootstrapped(db):
+        return False
+    holder = holder or worker_id()
+    deadline = asyncio.get_running_loop().time() + wait
+    while not await acquire_lease(db, "bootstrap", holder, ttl):
+        if await bootstrapped(db):
+            return False
+        if asyncio.get_running_loop().time() >= deadline:
+            raise RuntimeError("Timed out waiting for another worker to bootstrap the database")
+        await asyncio.sleep(0.25)
+    try:
+        state = await bootstrap_state(db)
+        if _seeded(state) and _indexed(state):
+            return False
+        if not _indexed(state):
+            await apply_indexes(db)
+            logger.info("Applied the index manifest")
+        if not _seeded(state):
+            seeded = await seed_bonds(db) if os.environ.get("SEED_DEMO_BONDS", "true").lower() == "true" else 0
+            if seeded:
+                logger.info(f"Seeded {seeded} bonds")
+        await db.meta.update_one(
+            {"_id": "bootstrap"},
+            {"$set": {
+                "version": BOOTSTRAP_VERSION,
+                "indexes": manifest_hash(),
+                "completed_at": datetime.now(timezone.utc),
+                "holder": holder
+            }},
+            upsert=True
+        )
+        return True
+    finally:
+        await release_lease(db, "bootstrap", holder)
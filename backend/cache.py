@@ -0,0 +1,196 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+class LRUCache:
+    """Bounded LRU map whose entries expire at an absolute wall-clock time."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.time() >= expires_at:
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, expires_at: Optional[float] = None):
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MemoryStore:
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self._entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._generations = OrderedDict()
+        self._counter = 0
+        # Generation reported for keys whose counter was evicted; never below any evicted value
+        self._floor = 0
+
+    async def get(self, key: str, field: str):
+        entry = self._entries.get(key)
+        return entry.get(field) if entry else None
+
+    async def lookup(self, key: str, field: str) -> tuple:
+        return await self.get(key, field), self._generations.get(key, self._floor)
+
+    async def set(self, key: str, field: str, value, generation: Optional[int] = None):
+        if generation is not None and self._generations.get(key, self._floor) != generation:
+            return
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {}
+            self._entries.set(key, entry)
+        entry[field] = value
+
+    async def delete(self, key: str):
+        self._entries.delete(key)
+        self._counter += 1
+        self._generations[key] = self._counter
+        self._generations.move_to_end(key)
+        while len(self._generations) > self.maxsize:
+            _, evicted = self._generations.popitem(last=False)
+            self._floor = max(self._floor, evicted)
+
+    async def close(self):
+        self._entries.clear()
+
+
+class RedisStore:
+    """Shared store for multi-worker deployments; needs the optional redis package."""
+
+    # Write the field only if the key's generation is still the one read before computing it
+    SET_IF_GENERATION = """
+    if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('HSET', KEYS[1], ARGV[2], ARGV[3])
+    if tonumber(ARGV[4]) > 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[4])
+    end
+    return 1
+    """
+
+    # Generation counters outlive cached fields so a slow miss cannot see an expired counter reset
+    GENERATION_TTL = 86400
+
+    def __init__(self, url: str, ttl: Optional[float] = None, prefix: str = "bondfi:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis cache backend")
+        self._redis = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _generation_key(self, key: str) -> str:
+        return f"{self.prefix}gen:{key}"
+
+    async def get(self, key: str, field: str):
+        raw = await self._redis.hget(self.prefix + key, field)
+        return json.loads(raw) if raw is not None else None
+
+    async def lookup(self, key: str, field: str) -> tuple:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hget(self.prefix + key, field)
+            pipe.get(self._generation_key(key))
+            raw, generation = await pipe.execute()
+        return (json.loads(raw) if raw is not None else None), int(generation or 0)
+
+    async def set(self, key: str, field: str, value, generation: Optional[int] = None):
+        payload = json.dumps(value, separators=(",", ":"))
+        if generation is not None:
+            await self._redis.eval(
+                self.SET_IF_GENERATION, 2, self.prefix + key, self._generation_key(key),
+                str(generation), field, payload, int(self.ttl or 0)
+            )
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hset(self.prefix + key, field, payload)
+            if self.ttl:
+                pipe.expire(self.prefix + key, int(self.ttl))
+            await pipe.execute()
+
+    async def delete(self, key: str):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self.prefix + key)
+            pipe.incr(self._generation_key(key))
+            pipe.expire(self._generation_key(key), self.GENERATION_TTL)
+            await pipe.execute()
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class ResponseCache:
+    """Per-user cache of computed responses; every field for a user is dropped on invalidate.
+
+    Invalidating also bumps the user's generation. A miss reads the generation with
+    lookup() before computing and passes it to set(), which drops the write if an
+    invalidate happened in between, so a response computed before a write is never cached after it.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key: str, field: str):
+        value = await self.store.get(key, field)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def lookup(self, key: str, field: str) -> tuple:
+        """Return (cached value or None, generation to pass to set)."""
+        value, generation = await self.store.lookup(key, field)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value, generation
+
+    async def set(self, key: str, field: str, value, generation: Optional[int] = None):
+        await self.store.set(key, field, value, generation)
+
+    async def invalidate(self, key: str):
+        await self.store.delete(key)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
+
+
+def build_store(backend: str, url: Optional[str] = None, maxsize: int = 10000, ttl: Optional[float] = None, prefix: str = "bondfi:"):
+    if backend == "redis":
+        return RedisStore(url or "redis://localhost:6379/0", ttl=ttl, prefix=prefix)
+    return MemoryStore(maxsize=maxsize, ttl=ttl)
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict
+from pymongo.errors import PyMongoError
+
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+
+class Bond(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    country: str
+    country_code: str
+    yield_percentage: float
+    maturity_date: str
+    minimum_entry: float
+    flag_url: str
+    description: str
+    issuer: str
+
+
+class BondCatalog:
+    """In-process copy of the bonds collection, refreshed on a TTL or from a change stream."""
+
+    def __init__(self, model, ttl: float = 300.0, max_time_ms: Optional[int] = None):
+        self.model = model
+        self.ttl = ttl
+        self.max_time_ms = max_time_ms
+        self.version = 0
+        self.etag = None
+        self.payload = b"[]"
+        self._bonds = {}
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+        self._watcher = None
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self._loaded_at >= self.ttl
+
+    async def refresh(self, db):
+        async with self._lock:
+            docs = await db.bonds.find({}, {"_id": 0}, max_time_ms=self.max_time_ms).sort("id", 1).to_list(None)
+            bonds = [self.model(**doc).model_dump() for doc in docs]
+            payload = dumps(bonds)
+            if payload != self.payload or self.etag is None:
+                self._bonds = {bond["id"]: bond for bond in bonds}
+                self.payload = payload
+                self.version += 1
+                self.etag = f'"{self.version}-{hashlib.sha1(payload).hexdigest()[:16]}"'
+            self._loaded_at = time.monotonic()
+
+    async def ensure_fresh(self, db):
+        if self.stale and not self._lock.locked():
+            await self.refresh(db)
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+
+    def get(self, bond_id: str) -> Optional[dict]:
+        return self._bonds.get(bond_id)
+
+    def list(self) -> list:
+        return list(self._bonds.values())
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match or self.etag is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/") == self.etag for tag in tags)
+
+    def start_watching(self, db):
+        self._watcher = asyncio.create_task(self._watch(db))
+
+    async def stop_watching(self):
+        if self._watcher:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    async def _watch(self, db):
+        try:
+            async with db.bonds.watch() as stream:
+                async for _ in stream:
+                    await self.refresh(db)
+        except (PyMongoError, NotImplementedError, TypeError) as exc:
+            logger.info(f"Bond change stream unavailable, using {self.ttl}s TTL refresh: {exc}")
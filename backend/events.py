@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """One connected client. When its queue overflows the backlog is dropped and a resync is sent."""
+
+    def __init__(self, email: str, queue_size: int):
+        self.email = email
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def put(self, event: dict):
+        if self.queue.full():
+            self.dropped += self.queue.qsize()
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = RESYNC
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisBroker:
+    """Fans events out across workers over Redis pub/sub; needs the optional redis package.
+
+    The listener reconnects with exponential backoff when the subscription drops. Events
+    published while it was away are lost, so local subscribers get a resync once it is back.
+    """
+
+    def __init__(self, url: str, channel: str = "bondfi:events", min_backoff: float = 0.5, max_backoff: float = 30.0):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("The redis package is required for the redis event broker")
+        self._redis = redis.from_url(url)
+        self.channel = channel
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.reconnects = 0
+        self._listener = None
+
+    async def publish(self, email: str, event: dict):
+        await self._redis.publish(self.channel, json.dumps({"email": email, "event": event}))
+
+    def start(self, deliver, resync):
+        self._listener = asyncio.create_task(self._listen(deliver, resync))
+
+    async def _listen(self, deliver, resync):
+        backoff = self.min_backoff
+        interrupted = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                if interrupted:
+                    self.reconnects += 1
+                    logger.info("Event broker resubscribed, asking local streams to resync")
+                    resync()
+                    interrupted = False
+                backoff = self.min_backoff
+                async for message in pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    try:
+                        payload = json.loads(message["data"])
+                        deliver(payload["email"], payload["event"])
+                    except (ValueError, KeyError, TypeError) as exc:
+                        logger.warning(f"Dropping malformed event broker message: {exc}")
+                logger.warning("Event broker subscription ended, reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning(f"Event broker subscription failed, retrying in {backoff:.1f}s: {exc}")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception:
+                    pass
+            interrupted = True
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def close(self):
+        if self._listener:
+            self._listener.cancel()
+        await self._redis.aclose()
+
+
+class EventHub:
+    """In-process pub/sub of per-user wallet and holding updates."""
+
+    def __init__(self, queue_size: int = 64, broker=None):
+        self.queue_size = queue_size
+        self.broker = broker
+        self._subscribers = {}
+
+    @property
+    def connections(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def start(self):
+        if self.broker:
+            self.broker.start(self.deliver, self.resync)
+
+    async def close(self):
+        if self.broker:
+            await self.broker.close()
+
+    def subscribe(self, email: str) -> Subscription:
+        subscription = Subscription(email, self.queue_size)
+        self._subscribers.setdefault(email, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subs = self._subscribers.get(subscription.email)
+        if subs is not None:
+            subs.discard(subscription)
+            if not subs:
+                del self._subscribers[subscription.email]
+
+    def deliver(self, email: str, event: dict):
+        for subscription in self._subscribers.get(email, ()):
+            subscription.put(event)
+
+    def resync(self):
+        """Tell every local stream its event history may have gaps."""
+        for subs in self._subscribers.values():
+            for subscription in subs:
+                subscription.put(RESYNC)
+
+    async def publish(self, email: str, event: dict):
+        if self.broker is None:
+            self.deliver(email, event)
+            return
+        try:
+            await self.broker.publish(email, event)
+        except Exception as exc:
+            logger.warning(f"Event broker publish failed, delivering locally: {exc}")
+            self.deliver(email, event)
+
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
@@ -0,0 +1,81 @@
+import base64
+import csv
+import io
+import json
+from typing import Optional
+
+from pymongo import DESCENDING
+
+HISTORY_SORT = [("id", DESCENDING)]
+TRANSACTION_FIELDS = {
+    "_id": 0, "id": 1, "email": 1, "bond_id": 1, "bond_country": 1,
+    "amount": 1, "tokens_received": 1, "timestamp": 1, "transaction_type": 1
+}
+EXPORT_FIELDS = ["id", "timestamp", "transaction_type", "bond_id", "bond_country", "amount", "tokens_received"]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(transaction: dict) -> str:
+    return base64.urlsafe_b64encode(transaction["id"].encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    except ValueError as exc:
+        raise InvalidCursor(str(exc))
+
+
+def page_query(email: str, cursor: Optional[str] = None) -> dict:
+    query = {"email": email}
+    if cursor:
+        query["id"] = {"$lt": decode_cursor(cursor)}
+    return query
+
+
+async def fetch_page(db, email: str, limit: int, cursor: Optional[str] = None, max_time_ms: Optional[int] = None):
+    """Return one page of history, newest first, and the cursor for the next page."""
+    transactions = await db.transactions.find(
+        page_query(email, cursor),
+        TRANSACTION_FIELDS,
+        max_time_ms=max_time_ms
+    ).sort(HISTORY_SORT).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(transactions) > limit:
+        transactions = transactions[:limit]
+        next_cursor = encode_cursor(transactions[-1])
+    return transactions, next_cursor
+
+
+async def export_history(db, email: str, fmt: str = "ndjson", chunk_size: int = 500, max_time_ms: Optional[int] = None):
+    """Yield the full history as NDJSON or CSV chunks straight off the cursor."""
+    cursor = db.transactions.find(
+        {"email": email},
+        {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}},
+        batch_size=chunk_size,
+        max_time_ms=max_time_ms
+    ).sort(HISTORY_SORT)
+
+    buffer = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+
+    rows = 0
+    async for transaction in cursor:
+        if writer:
+            writer.writerow(transaction)
+        else:
+            buffer.write(json.dumps(transaction, separators=(",", ":")))
+            buffer.write("\n")
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,125 @@
+import asyncio
+
+from pymongo import ReplaceOne, UpdateOne
+
+# Principal bought per purchase day, keyed by ISO date, used for valuation; not returned to clients
+LOT_FIELDS = ("lots",)
+
+
+async def apply_buys(db, transactions: list, sign: int = 1, session=None) -> list:
+    """Fold buy transactions into their holdings with one bulk write; sign=-1 reverts them.
+
+    Each buy also adds its amount to the holding's lot for its purchase day, so
+    history can be valued per lot from the day it was bought.
+    Returns the (email, bond_id) pairs whose holding document was created by this write.
+    """
+    totals = {}
+    for txn in transactions:
+        key = (txn["email"], txn["bond_id"])
+        total = totals.setdefault(key, {"country": txn["bond_country"], "inc": {"tokens": 0, "invested": 0}})
+        lot = f"lots.{txn['timestamp'][:10]}"
+        total["inc"]["tokens"] += sign * txn["tokens_received"]
+        total["inc"]["invested"] += sign * txn["amount"]
+        total["inc"][lot] = total["inc"].get(lot, 0) + sign * txn["amount"]
+    ops = [
+        UpdateOne(
+            {"email": email, "bond_id": bond_id},
+            {"$inc": total["inc"], "$setOnInsert": {"country": total["country"]}},
+            upsert=True
+        )
+        for (email, bond_id), total in totals.items()
+    ]
+    if not ops:
+        return []
+    result = await db.holdings.bulk_write(ops, ordered=False, session=session)
+    keys = list(totals)
+    return [keys[index] for index in result.upserted_ids]
+
+
+async def drop_emptied(db, pairs: list, session=None) -> list:
+    """Delete the holdings among (email, bond_id) pairs that a revert left without tokens.
+
+    Returns the pairs actually removed; a holding a concurrent buy added to is kept.
+    """
+    deletes = [
+        db.holdings.delete_one({"email": email, "bond_id": bond_id, "tokens": {"$lte": 0}}, session=session)
+        for email, bond_id in pairs
+    ]
+    if session is None:
+        results = await asyncio.gather(*deletes)
+    else:
+        # A session cannot run operations concurrently
+        results = [await delete for delete in deletes]
+    return [pair for pair, result in zip(pairs, results) if result.deleted_count]
+
+
+async def get_user_holdings(db, email: str) -> list:
+    return [
+        holding async for holding in db.holdings.find({"email": email}, {"_id": 0, "email": 0})
+    ]
+
+
+async def rebuild_holdings(db, email: str = None, batch_size: int = 500) -> int:
+    """Recompute holdings and their purchase-day lots from the buy transactions and replace the stored documents."""
+    match = {"transaction_type": "buy"}
+    if email:
+        match["email"] = email
+    # One row per holding and purchase day, in holding order, so each holding is folded and written in turn
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": {"email": "$email", "bond_id": "$bond_id", "day": {"$substr": ["$timestamp", 0, 10]}},
+            "country": {"$first": "$bond_country"},
+            "tokens": {"$sum": "$tokens_received"},
+            "invested": {"$sum": "$amount"}
+        }},
+        {"$sort": {"_id.email": 1, "_id.bond_id": 1, "_id.day": 1}}
+    ]
+
+    rebuilt = 0
+    seen = set()
+    ops = []
+    current = None
+    async for row in db.transactions.aggregate(pipeline, allowDiskUse=True):
+        key = (row["_id"]["email"], row["_id"]["bond_id"])
+        if current is None or (current["email"], current["bond_id"]) != key:
+            if current is not None:
+                ops.append(ReplaceOne({"email": current["email"], "bond_id": current["bond_id"]}, current, upsert=True))
+            if len(ops) >= batch_size:
+                await db.holdings.bulk_write(ops, ordered=False)
+                rebuilt += len(ops)
+                ops = []
+            seen.add(key)
+            current = {
+                "email": key[0],
+                "bond_id": key[1],
+                "country": row["country"],
+                "tokens": 0,
+                "invested": 0,
+                "lots": {}
+            }
+        current["tokens"] += row["tokens"]
+        current["invested"] += row["invested"]
+        current["lots"][row["_id"]["day"]] = row["invested"]
+    if current is not None:
+        ops.append(ReplaceOne({"email": current["email"], "bond_id": current["bond_id"]}, current, upsert=True))
+    if ops:
+        await db.holdings.bulk_write(ops, ordered=False)
+        rebuilt += len(ops)
+
+    stale_query = {"email": email} if email else {}
+    stale = [
+        doc["_id"] async for doc in db.holdings.find(stale_query, {"email": 1, "bond_id": 1})
+        if (doc["email"], doc["bond_id"]) not in seen
+    ]
+    if stale:
+        await db.holdings.delete_many({"_id": {"$in": stale}})
+    return rebuilt
+
+
+async def backfill_lots(db) -> int:
+    """Rebuild the holdings of every user whose holdings predate purchase-day lots."""
+    emails = await db.holdings.distinct("email", {"lots": {"$exists": False}})
+    for email in emails:
+        await rebuild_holdings(db, email=email)
+    return len(emails)
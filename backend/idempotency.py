@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+PENDING = "pending"
+DONE = "done"
+
+MAX_KEY_LENGTH = 255
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyMismatch(Exception):
+    pass
+
+
+class IdempotencyInProgress(Exception):
+    pass
+
+
+def fingerprint(route: str, payload) -> str:
+    return hashlib.sha256(json.dumps([route, payload], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _aware(value: datetime) -> datetime:
+    # The Motor client is not tz_aware, so stored datetimes come back naive in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class IdempotencyStore:
+    """Runs a handler at most once per (email, Idempotency-Key) and replays its stored response.
+
+    The first request claims the key with a single upsert on the unique (email, key)
+    index; its response, or its 4xx error, is saved for ttl seconds and a TTL index
+    reaps it afterwards. Duplicates arriving on the same worker wait on the owner's
+    future without touching Mongo; duplicates on other workers poll the record by _id
+    until it completes. The owner renews its claim every third of lock_timeout while
+    the handler runs, so only a claim whose owner died is taken over once lock_timeout passes.
+    """
+
+    def __init__(self, ttl: float = 86400.0, lock_timeout: float = 30.0, wait: float = 10.0, poll_interval: float = 0.05):
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self._inflight = {}
+
+    def _claim_fields(self, now: datetime, digest: str, route: str) -> dict:
+        return {
+            "route": route,
+            "fingerprint": digest,
+            "status": PENDING,
+            "claim": uuid.uuid4().hex,
+            "locked_until": now + timedelta(seconds=self.lock_timeout),
+            "expires_at": now + timedelta(seconds=self.ttl),
+            "created_at": now
+        }
+
+    async def _claim(self, db, email: str, key: str, route: str, digest: str):
+        """Return (claim token, None) when this request owns the key, else (None, existing record)."""
+        now = datetime.now(timezone.utc)
+        fields = self._claim_fields(now, digest, route)
+        try:
+            record = await db.idempotency_keys.find_one_and_update(
+                {"email": email, "key": key},
+                {"$setOnInsert": fields},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # Lost an upsert race on the unique index; the winner's record is there unless it already failed
+            return None, await db.idempotency_keys.find_one({"email": email, "key": key})
+        if record is None:
+            return fields["claim"], None
+        stale = _aware(record["expires_at"]) <= now or (
+            record["status"] == PENDING and _aware(record["locked_until"]) <= now
+        )
+        if stale:
+            taken = await db.idempotency_keys.update_one(
+                {"_id": record["_id"], "claim": record["claim"]},
+                {"$set": fields, "$unset": {"status_code": "", "body": ""}}
+            )
+            if taken.modified_count:
+                return fields["claim"], None
+            record = await db.idempotency_keys.find_one({"_id": record["_id"]})
+        return None, record
+
+    async def _renew(self, db, email: str, key: str, claim: str):
+        """Push locked_until forward until cancelled, so a slow handler is not mistaken for a dead one."""
+        while True:
+            await asyncio.sleep(self.lock_timeout / 3)
+            renewed = await db.idempotency_keys.update_one(
+                {"email": email, "key": key, "claim": claim, "status": PENDING},
+                {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=self.lock_timeout)}}
+            )
+            if not renewed.matched_count:
+                logger.warning(f"Lost the idempotency claim on {key} for {email} while its handler was running")
+                return
+
+    async def _execute(self, db, email: str, key: str, claim: str, handler) -> dict:
+        renewer = asyncio.create_task(self._renew(db, email, key, claim))
+        try:
+            status_code, body = 200, await handler()
+        except HTTPException as exc:
+            if exc.status_code >= 500:
+                await db.idempotency_keys.delete_one({"email": email, "key": key, "claim": claim})
+                raise
+            status_code, body = exc.status_code, exc.detail
+        except BaseException:
+            await db.idempotency_keys.delete_one({"email": email, "key": key, "claim": claim})
+            raise
+        finally:
+            renewer.cancel()
+        stored = await db.idempotency_keys.update_one(
+            {"email": email, "key": key, "claim": claim},
+            {"$set": {"status": DONE, "status_code": status_code, "body": body}, "$unset": {"locked_until": ""}}
+        )
+        if not stored.matched_count:
+            logger.warning(f"Idempotency claim on {key} for {email} was taken over before its response was stored")
+        return {"status_code": status_code, "body": body}
+
+    async def _await_record(self, db, record: dict, digest: str) -> dict:
+        deadline = asyncio.get_running_loop().time() + self.wait
+        while True:
+            if record is None:
+                return None
+            if record["fingerprint"] != digest:
+                raise IdempotencyMismatch()
+            if record["status"] == DONE:
+                return record
+            if asyncio.get_running_loop().time() >= deadline:
+                raise IdempotencyInProgress()
+            await asyncio.sleep(self.poll_interval)
+            record = await db.idempotency_keys.find_one(
+                {"_id": record["_id"]}, {"fingerprint": 1, "status": 1, "status_code": 1, "body": 1}
+            )
+
+    async def run(self, db, email: str, key: str, route: str, payload, handler) -> tuple:
+        """Return (status_code, body, replayed) for the request; handler is awaited at most once per key."""
+        digest = fingerprint(route, payload)
+        slot = (email, key)
+        inflight = self._inflight.get(slot)
+        if inflight is not None:
+            owner_digest, future = inflight
+            if owner_digest != digest:
+                raise IdempotencyMismatch()
+            result = await asyncio.shield(future)
+            if result is None:
+                # The owner failed without storing a response, so the key is free again
+                return await self.run(db, email, key, route, payload, handler)
+            return result["status_code"], result["body"], True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[slot] = (digest, future)
+        result = None
+        try:
+            claim, record = await self._claim(db, email, key, route, digest)
+            if claim is not None:
+                result, replayed = await self._execute(db, email, key, claim, handler), False
+            else:
+                result, replayed = await self._await_record(db, record, digest), True
+        finally:
+            del self._inflight[slot]
+            future.set_result(result)
+        if result is None:
+            return await self.run(db, email, key, route, payload, handler)
+        return result["status_code"], result["body"], replayed
@@ -0,0 +1,92 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ASCENDING, UpdateOne
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+RANDOM_BITS = 80
+RANDOM_LIMIT = 1 << RANDOM_BITS
+LEGACY_ID = re.compile(r"^txn_(\d+(?:\.\d+)?)(?:_\d+)?$")
+
+
+def encode(value: int) -> str:
+    chars = []
+    for _ in range(26):
+        chars.append(ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
+
+
+def decode_time(ulid: str) -> datetime:
+    """Creation time encoded in the first ten characters of a ULID."""
+    millis = 0
+    for char in ulid[:10]:
+        millis = millis * 32 + ALPHABET.index(char)
+    return datetime.fromtimestamp(millis / 1000).astimezone()
+
+
+class ULIDGenerator:
+    """Monotonic ULIDs: 48-bit millisecond time plus 80 random bits, incremented within a millisecond."""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new(self, millis: Optional[int] = None) -> str:
+        millis = time.time_ns() // 1_000_000 if millis is None else millis
+        with self._lock:
+            if millis <= self._last_ms:
+                millis = self._last_ms
+                random = self._last_random + 1
+                if random >= RANDOM_LIMIT:
+                    millis += 1
+                    random = int.from_bytes(os.urandom(10), "big")
+            else:
+                random = int.from_bytes(os.urandom(10), "big")
+            self._last_ms = millis
+            self._last_random = random
+        return self.prefix + encode((millis << RANDOM_BITS) | random)
+
+
+def legacy_millis(txn_id: str, timestamp: Optional[str] = None) -> Optional[int]:
+    """Creation time of an old txn_<epoch float> ID, falling back to its ISO timestamp."""
+    match = LEGACY_ID.match(txn_id)
+    if match:
+        return int(float(match.group(1)) * 1000)
+    if timestamp:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    return None
+
+
+async def migrate_legacy_ids(db, batch_size: int = 500) -> int:
+    """Rewrite txn_<epoch float> IDs as ULIDs carrying the same creation time; the old ID is kept in legacy_id."""
+    generator = ULIDGenerator(prefix="txn_")
+    cursor = db.transactions.find(
+        {"id": {"$regex": LEGACY_ID.pattern}},
+        {"_id": 1, "id": 1, "timestamp": 1}
+    ).sort([("timestamp", ASCENDING), ("_id", ASCENDING)])
+
+    migrated = 0
+    ops = []
+    async for txn in cursor:
+        new_id = generator.new(legacy_millis(txn["id"], txn.get("timestamp")))
+        ops.append(UpdateOne({"_id": txn["_id"]}, {"$set": {"id": new_id, "legacy_id": txn["id"]}}))
+        if len(ops) >= batch_size:
+            await db.transactions.bulk_write(ops, ordered=False)
+            migrated += len(ops)
+            ops = []
+    if ops:
+        await db.transactions.bulk_write(ops, ordered=False)
+        migrated += len(ops)
+    return migrated
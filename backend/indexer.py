@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from settlement import SETTLED, to_units
+
+logger = logging.getLogger(__name__)
+
+# Which topic address is debited and which is credited, per SEP-41 token event
+BALANCE_EVENTS = {
+    "transfer": (0, 1),
+    "mint": (None, -1),
+    "burn": (0, None),
+    "clawback": (-1, None),
+}
+
+
+def _is_address(value) -> bool:
+    return isinstance(value, str) and len(value) == 56 and value[0] in "GCM"
+
+
+def normalize(event: dict) -> dict:
+    """Flatten a decoded contract event into the chain_events document shape."""
+    topic = event["topic"]
+    kind = str(topic[0]) if topic else ""
+    addresses = [value for value in topic[1:] if _is_address(value)]
+    debit, credit = BALANCE_EVENTS.get(kind, (None, None))
+    source = addresses[debit] if debit is not None and addresses else None
+    target = addresses[credit] if credit is not None and addresses else None
+    return {
+        "event_id": event["id"],
+        "ledger": event["ledger"],
+        "closed_at": event.get("ledger_closed_at"),
+        "contract_id": event["contract_id"],
+        "tx_hash": event.get("tx_hash"),
+        "kind": kind,
+        "from": source,
+        "to": target,
+        "amount": int(event["value"]) if kind in BALANCE_EVENTS else None,
+        "topic": [str(value) for value in topic],
+    }
+
+
+class FixtureSource:
+    """Replays a recorded JSON-lines file of decoded events, paging by event id like the RPC does."""
+
+    def __init__(self, path: str):
+        with open(path) as handle:
+            self._events = sorted(
+                (json.loads(line) for line in handle if line.strip()),
+                key=lambda event: event["id"]
+            )
+
+    async def fetch(self, contract_id: str, cursor: Optional[str], limit: int) -> list:
+        return [
+            event for event in self._events
+            if event["contract_id"] == contract_id and (cursor is None or event["id"] > cursor)
+        ][:limit]
+
+
+class SorobanEventSource:
+    """Pages getEvents for one contract from Soroban RPC; needs the optional stellar-sdk package."""
+
+    def __init__(self, rpc_url: str, start_ledger: int):
+        try:
+            import stellar_sdk
+        except ImportError:
+            raise RuntimeError("The stellar-sdk package is required for the Soroban event source")
+        from stellar_sdk import SorobanServerAsync
+        from stellar_sdk.client.aiohttp_client import AiohttpClient
+
+        self._sdk = stellar_sdk
+        self._server = SorobanServerAsync(rpc_url, client=AiohttpClient())
+        self.start_ledger = start_ledger
+
+    def _native(self, value: str):
+        native = self._sdk.scval.to_native(self._sdk.xdr.SCVal.from_xdr(value))
+        return getattr(native, "address", native)
+
+    async def fetch(self, contract_id: str, cursor: Optional[str], limit: int) -> list:
+        from stellar_sdk.soroban_rpc import EventFilter, EventFilterType
+
+        filters = [EventFilter(event_type=EventFilterType.CONTRACT, contract_ids=[contract_id])]
+        response = await self._server.get_events(
+            start_ledger=None if cursor else self.start_ledger,
+            filters=filters,
+            cursor=cursor,
+            limit=limit
+        )
+        return [
+            {
+                "id": event.id,
+                "ledger": event.ledger,
+                "ledger_closed_at": event.ledger_close_at,
+                "contract_id": event.contract_id,
+                "tx_hash": getattr(event, "transaction_hash", None),
+                "topic": [self._native(value) for value in event.topic],
+                "value": self._native(event.value),
+            }
+            for event in response.events
+        ]
+
+    async def close(self):
+        await self._server.close()
+
+
+class ChainIndexer:
+    """Tails one contract's events into chain_events and keeps chain_balances materialized.
+
+    Each page is inserted, folded into balances, then the cursor is saved. Every step
+    is idempotent: events are unique by event_id and each balance remembers the last
+    event it absorbed, so a crash at any point just replays the page on restart.
+    Run a single indexer per contract.
+    """
+
+    def __init__(self, db, source, contract_id: str, batch_size: int = 1000):
+        self.db = db
+        self.source = source
+        self.contract_id = contract_id
+        self.batch_size = batch_size
+
+    async def cursor(self) -> Optional[str]:
+        state = await self.db.indexer_state.find_one({"_id": self.contract_id})
+        return state["cursor"] if state else None
+
+    async def _insert(self, events: list):
+        try:
+            await self.db.chain_events.insert_many(events, ordered=False)
+        except BulkWriteError as exc:
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+
+    async def _apply_balances(self, events: list):
+        addresses = {event[side] for event in events for side in ("from", "to") if event[side]}
+        if not addresses:
+            return
+        applied = {
+            row["address"]: row["through"]
+            async for row in self.db.chain_balances.find(
+                {"contract_id": self.contract_id, "address": {"$in": list(addresses)}},
+                {"_id": 0, "address": 1, "through": 1}
+            )
+        }
+        deltas = {}
+        for event in events:
+            for side, sign in (("from", -1), ("to", 1)):
+                address = event[side]
+                if address and event["event_id"] > applied.get(address, ""):
+                    delta = deltas.setdefault(address, {"amount": 0, "through": event["event_id"]})
+                    delta["amount"] += sign * event["amount"]
+                    delta["through"] = event["event_id"]
+        ops = [
+            UpdateOne(
+                {"contract_id": self.contract_id, "address": address},
+                {"$inc": {"balance": delta["amount"]}, "$set": {"through": delta["through"]}},
+                upsert=True
+            )
+            for address, delta in deltas.items()
+        ]
+        if ops:
+            await self.db.chain_balances.bulk_write(ops, ordered=False)
+
+    async def run_once(self) -> int:
+        """Index one page of events; returns how many were read."""
+        raw = await self.source.fetch(self.contract_id, await self.cursor(), self.batch_size)
+        if not raw:
+            return 0
+        events = [normalize(event) for event in raw]
+        await self._insert([dict(event) for event in events])
+        await self._apply_balances([event for event in events if event["amount"] is not None])
+        last = events[-1]
+        await self.db.indexer_state.update_one(
+            {"_id": self.contract_id},
+            {"$set": {"cursor": last["event_id"], "ledger": last["ledger"]}},
+            upsert=True
+        )
+        return len(events)
+
+    async def run(self, interval: float = 5.0):
+        while True:
+            try:
+                indexed = await self.run_once()
+            except Exception as exc:
+                logger.error(f"Chain indexer page failed for {self.contract_id}: {exc}")
+                indexed = 0
+            if indexed < self.batch_size:
+                await asyncio.sleep(interval)
+
+
+async def reconcile(db, contract_id: str, bond_ids: list, custody_address: Optional[str] = None) -> list:
+    """Join indexed on-chain balances with what the off-chain records expect each address to hold.
+
+    Users with a linked stellar_address are expected to hold their holdings tokens for
+    bond_ids; the custody account is expected to hold every settled purchase of them.
+    Returns one row per address where the two disagree.
+    """
+    expected = {}
+    linked = {
+        user["email"]: user["stellar_address"]
+        async for user in db.users.find(
+            {"stellar_address": {"$exists": True}}, {"_id": 0, "email": 1, "stellar_address": 1}
+        )
+    }
+    if linked:
+        async for holding in db.holdings.find(
+            {"email": {"$in": list(linked)}, "bond_id": {"$in": bond_ids}},
+            {"_id": 0, "email": 1, "tokens": 1}
+        ):
+            address = linked[holding["email"]]
+            expected[address] = expected.get(address, 0) + to_units(holding["tokens"])
+    if custody_address:
+        settled = await db.settlements.aggregate([
+            {"$match": {"status": SETTLED, "bond_id": {"$in": bond_ids}}},
+            {"$group": {"_id": None, "units": {"$sum": "$units"}}}
+        ]).to_list(1)
+        expected[custody_address] = expected.get(custody_address, 0) + (settled[0]["units"] if settled else 0)
+
+    chain = {
+        row["address"]: row["balance"]
+        async for row in db.chain_balances.find({"contract_id": contract_id}, {"_id": 0, "address": 1, "balance": 1})
+    }
+    emails = {address: email for email, address in linked.items()}
+    mismatches = []
+    for address in sorted(set(expected) | set(chain)):
+        on_chain, off_chain = chain.get(address, 0), expected.get(address, 0)
+        if on_chain != off_chain:
+            mismatches.append({
+                "address": address,
+                "email": emails.get(address),
+                "chain_units": on_chain,
+                "expected_units": off_chain,
+                "difference": on_chain - off_chain,
+            })
+    return mismatches
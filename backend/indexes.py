@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "wallets": [
+        IndexModel([("email", ASCENDING)], unique=True, name="email_unique"),
+    ],
+    "bonds": [
+        IndexModel([("id", ASCENDING)], unique=True, name="id_unique"),
+    ],
+    "transactions": [
+        IndexModel([("email", ASCENDING), ("id", DESCENDING)], name="email_id"),
+        IndexModel(
+            [("email", ASCENDING), ("transaction_type", ASCENDING), ("timestamp", DESCENDING)],
+            name="email_type_timestamp"
+        ),
+    ],
+    "holdings": [
+        IndexModel([("email", ASCENDING), ("bond_id", ASCENDING)], unique=True, name="email_bond_id"),
+    ],
+    "wallet_ledger": [
+        IndexModel([("email", ASCENDING), ("seq", ASCENDING)], unique=True, name="email_seq"),
+    ],
+    "wallet_snapshots": [
+        IndexModel([("email", ASCENDING), ("seq", DESCENDING)], unique=True, name="email_seq"),
+    ],
+    "settlements": [
+        IndexModel([("txn_id", ASCENDING)], unique=True, name="txn_id_unique"),
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("batch_id", ASCENDING)], name="batch_id"),
+    ],
+    "bond_quotes": [
+        IndexModel([("bond_id", ASCENDING), ("day", ASCENDING)], unique=True, name="bond_day_unique"),
+    ],
+    "idempotency_keys": [
+        IndexModel([("email", ASCENDING), ("key", ASCENDING)], unique=True, name="email_key_unique"),
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    ],
+    "daily_bond_stats": [
+        IndexModel([("day", ASCENDING), ("bond_id", ASCENDING)], unique=True, name="day_bond_unique"),
+    ],
+    "chain_events": [
+        IndexModel([("event_id", ASCENDING)], unique=True, name="event_id_unique"),
+        IndexModel([("contract_id", ASCENDING), ("ledger", ASCENDING)], name="contract_ledger"),
+        IndexModel([("tx_hash", ASCENDING)], name="tx_hash"),
+    ],
+    "chain_balances": [
+        IndexModel([("contract_id", ASCENDING), ("address", ASCENDING)], unique=True, name="contract_address"),
+    ],
+}
+
+PROBE_EMAIL = "index-probe@example.com"
+
+HOT_QUERIES = [
+    ("users by email", "users", {"email": PROBE_EMAIL}, None),
+    ("wallets by email", "wallets", {"email": PROBE_EMAIL}, None),
+    ("bonds by id", "bonds", {"id": "bond_us_1"}, None),
+    ("transactions by email", "transactions", {"email": PROBE_EMAIL}, [("id", DESCENDING)]),
+    (
+        "buy transactions by email",
+        "transactions",
+        {"email": PROBE_EMAIL, "transaction_type": "buy"},
+        [("timestamp", DESCENDING)]
+    ),
+    ("holdings by email", "holdings", {"email": PROBE_EMAIL}, None),
+    ("ledger events since snapshot", "wallet_ledger", {"email": PROBE_EMAIL, "seq": {"$gt": 0}}, None),
+    ("latest wallet snapshot", "wallet_snapshots", {"email": PROBE_EMAIL}, [("seq", DESCENDING)]),
+    ("settlement by transaction", "settlements", {"txn_id": "txn_probe"}, None),
+    ("due settlements", "settlements", {"status": "pending"}, [("next_attempt_at", ASCENDING)]),
+    (
+        "bond quote history",
+        "bond_quotes",
+        {"bond_id": "bond_us_1", "day": {"$gte": "2024-01-01"}},
+        [("day", ASCENDING)]
+    ),
+    ("idempotency key", "idempotency_keys", {"email": PROBE_EMAIL, "key": "probe"}, None),
+    ("daily bond volume", "daily_bond_stats", {"day": {"$gte": "2024-01-01"}}, None),
+    ("chain balances by contract", "chain_balances", {"contract_id": "C_PROBE"}, None),
+]
+
+
+async def apply_indexes(db):
+    for collection, models in INDEXES.items():
+        await db[collection].create_indexes(models)
+
+
+def manifest_hash() -> str:
+    """Fingerprint of INDEXES, so bootstrap can tell when a deployment is missing new indexes."""
+    manifest = [
+        [collection, [{**model.document, "key": list(model.document["key"].items())} for model in models]]
+        for collection, models in sorted(INDEXES.items())
+    ]
+    return hashlib.sha1(json.dumps(manifest, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def explain_hot_queries(db) -> list:
+    """Explain each hot query and report the winning plan's stages."""
+    results = []
+    for name, collection, query, sort in HOT_QUERIES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        results.append({"name": name, "stages": stages, "collscan": "COLLSCAN" in stages})
+    return results
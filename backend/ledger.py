@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import math
+from datetime import datetime, timezone
+from typing import Optional
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+KINDS = ("credit", "debit", "reward")
+
+
+def build_entry(wallet: dict, kind: str, amount: float, refs: Optional[list] = None) -> dict:
+    """Ledger event for a wallet update that has already bumped ledger_seq and returned the new document."""
+    if kind not in KINDS:
+        raise ValueError(f"Unknown ledger entry kind: {kind}")
+    return {
+        "email": wallet["email"],
+        "seq": wallet["ledger_seq"],
+        "kind": kind,
+        "amount": -amount if kind == "debit" else amount,
+        "balance": wallet["usdc_balance"],
+        "refs": refs or [],
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+
+async def latest_snapshot(db, email: str) -> dict:
+    snapshot = await db.wallet_snapshots.find_one({"email": email}, {"_id": 0}, sort=[("seq", DESCENDING)])
+    return snapshot or {"email": email, "seq": 0, "balance": 0.0}
+
+
+async def _fold(db, email: str, after: int, upto: Optional[int] = None) -> dict:
+    seq_range = {"$gt": after}
+    if upto is not None:
+        seq_range["$lte"] = upto
+    rows = await db.wallet_ledger.aggregate([
+        {"$match": {"email": email, "seq": seq_range}},
+        {"$group": {"_id": None, "delta": {"$sum": "$amount"}, "last": {"$max": "$seq"}, "count": {"$sum": 1}}}
+    ]).to_list(1)
+    return rows[0] if rows else {"delta": 0.0, "last": after, "count": 0}
+
+
+class WalletLedger:
+    """Append-only wallet events with snapshots written every snapshot_every sequence numbers."""
+
+    def __init__(self, snapshot_every: int = 100):
+        self.snapshot_every = snapshot_every
+        self._compactions = set()
+
+    async def append(self, db, entry: dict, session=None):
+        await db.wallet_ledger.insert_one(entry, session=session)
+        if self.snapshot_every and entry["seq"] % self.snapshot_every == 0:
+            task = asyncio.create_task(self.compact(db, entry["email"], upto=entry["seq"]))
+            self._compactions.add(task)
+            task.add_done_callback(self._compactions.discard)
+
+    async def balance(self, db, email: str) -> tuple:
+        """Current balance and sequence number, folding only the events after the latest snapshot."""
+        snapshot = await latest_snapshot(db, email)
+        folded = await _fold(db, email, snapshot["seq"])
+        return snapshot["balance"] + folded["delta"], folded["last"]
+
+    async def compact(self, db, email: str, upto: int) -> Optional[dict]:
+        """Write a snapshot at upto; skipped while any earlier event is still missing or uncommitted."""
+        try:
+            snapshot = await latest_snapshot(db, email)
+            if snapshot["seq"] >= upto:
+                return None
+            folded = await _fold(db, email, snapshot["seq"], upto)
+            if folded["count"] != upto - snapshot["seq"]:
+                return None
+            new_snapshot = {
+                "email": email,
+                "seq": upto,
+                "balance": snapshot["balance"] + folded["delta"],
+                "timestamp": datetime.now(timezone.utc).isoformat()
+            }
+            await db.wallet_snapshots.insert_one(dict(new_snapshot))
+            return new_snapshot
+        except DuplicateKeyError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Ledger compaction failed for {email} at seq {upto}: {exc}")
+            return None
+
+    async def close(self):
+        if self._compactions:
+            await asyncio.gather(*self._compactions, return_exceptions=True)
+
+
+async def open_ledgers(db) -> int:
+    """Give wallets created before the ledger an opening credit for their current balance."""
+    opened = 0
+    async for wallet in db.wallets.find({"ledger_seq": {"$exists": False}}, {"email": 1}):
+        opening = await db.wallets.find_one_and_update(
+            {"email": wallet["email"], "ledger_seq": {"$exists": False}},
+            {"$set": {"ledger_seq": 1}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+        if opening is None:
+            continue
+        await db.wallet_ledger.insert_one(build_entry(opening, "credit", opening["usdc_balance"], ["opening"]))
+        opened += 1
+    return opened
+
+
+def _close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+
+
+async def verify_ledger(db, email: Optional[str] = None, batch_size: int = 5000) -> dict:
+    """Replay every event in (email, seq) order and check sequence gaps, running balances,
+    snapshots and the wallet documents against the replay."""
+    query = {"email": email} if email else {}
+    snapshots = {
+        (snap["email"], snap["seq"]): snap["balance"]
+        async for snap in db.wallet_snapshots.find(query, {"_id": 0, "email": 1, "seq": 1, "balance": 1})
+    }
+    problems = []
+    replayed = {}
+    entries = 0
+
+    cursor = db.wallet_ledger.find(
+        query,
+        {"_id": 0, "email": 1, "seq": 1, "amount": 1, "balance": 1},
+        batch_size=batch_size
+    ).sort([("email", ASCENDING), ("seq", ASCENDING)])
+    current, seq, balance = None, 0, 0.0
+    async for entry in cursor:
+        entries += 1
+        if entry["email"] != current:
+            if current is not None:
+                replayed[current] = (seq, balance)
+            current, seq, balance = entry["email"], 0, 0.0
+        if entry["seq"] != seq + 1:
+            problems.append(f"{current}: expected seq {seq + 1}, found {entry['seq']}")
+        seq = entry["seq"]
+        balance += entry["amount"]
+        if not _close(balance, entry["balance"]):
+            problems.append(f"{current}: seq {seq} records balance {entry['balance']}, replay gives {balance}")
+            balance = entry["balance"]
+        if (current, seq) in snapshots and not _close(snapshots[(current, seq)], balance):
+            problems.append(f"{current}: snapshot at seq {seq} holds {snapshots[(current, seq)]}, replay gives {balance}")
+    if current is not None:
+        replayed[current] = (seq, balance)
+
+    for snap_email, snap_seq in snapshots:
+        if snap_seq > replayed.get(snap_email, (0, 0.0))[0]:
+            problems.append(f"{snap_email}: snapshot at seq {snap_seq} is past the last event")
+
+    wallets = 0
+    async for wallet in db.wallets.find(query, {"_id": 0, "email": 1, "usdc_balance": 1, "ledger_seq": 1}):
+        wallets += 1
+        seq, balance = replayed.get(wallet["email"], (0, 0.0))
+        if wallet.get("ledger_seq", 0) != seq:
+            problems.append(f"{wallet['email']}: wallet is at seq {wallet.get('ledger_seq', 0)}, ledger ends at {seq}")
+        if not _close(wallet["usdc_balance"], balance):
+            problems.append(f"{wallet['email']}: wallet holds {wallet['usdc_balance']}, ledger replays to {balance}")
+
+    return {"wallets": wallets, "entries": entries, "snapshots": len(snapshots), "problems": problems}
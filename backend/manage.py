@@ -0,0 +1,355 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import ValidationError
+
+import analytics
+from bond_ingest import BondIngest, detect_format, iter_file_lines, parse_rows, validation_detail
+from bootstrap import bootstrap
+from catalog import Bond
+from holdings import backfill_lots, rebuild_holdings
+from ids import migrate_legacy_ids
+from indexer import ChainIndexer, FixtureSource, SorobanEventSource, reconcile
+from indexes import apply_indexes, explain_hot_queries
+from ledger import open_ledgers, verify_ledger
+from quotes import QuoteCreate, ingest_quotes
+from settlement import LocalRpc, SettlementWorker, SorobanRpc
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+# Per-process state that needs a shared backend once more than one worker serves traffic
+SHARED_STATE = {
+    "PORTFOLIO_CACHE_BACKEND": ("redis", "portfolio cache invalidations only reach the worker that handled the write"),
+    "RATE_LIMIT_STORE": ("shared", "each worker enforces its own copy of every rate limit"),
+}
+
+
+async def cmd_bootstrap(db, args):
+    applied = await bootstrap(db, wait=args.wait)
+    print("Bootstrap applied" if applied else "Bootstrap already current")
+    if args.migrations:
+        print(f"Migrated {await migrate_legacy_ids(db)} transaction IDs")
+        print(f"Opened {await open_ledgers(db)} wallet ledgers")
+        print(f"Backfilled holding lots for {await backfill_lots(db)} users")
+
+
+async def cmd_serve(db, args):
+    await bootstrap(db, wait=args.wait)
+
+
+def serve(args):
+    """Replace this process with uvicorn running --workers processes that skip their own bootstrap."""
+    if args.workers > 1:
+        for name, (expected, problem) in SHARED_STATE.items():
+            if os.environ.get(name) != expected:
+                print(f"Warning: {name} is not {expected}; {problem}")
+        if not os.environ.get("EVENTS_BROKER_URL"):
+            print("Warning: EVENTS_BROKER_URL is unset; event streams only see updates made on their own worker")
+    env = dict(os.environ, BOOTSTRAP_ON_STARTUP="false")
+    os.chdir(ROOT_DIR)
+    os.execvpe(sys.executable, [
+        sys.executable, "-m", "uvicorn", "server:app",
+        "--host", args.host, "--port", str(args.port),
+        "--workers", str(args.workers), "--log-level", args.log_level
+    ], env)
+
+
+async def cmd_ensure_indexes(db, args):
+    await apply_indexes(db)
+    print("Indexes applied")
+
+
+async def cmd_check_indexes(db, args):
+    if args.apply:
+        await apply_indexes(db)
+    failed = False
+    for result in await explain_hot_queries(db):
+        status = "COLLSCAN" if result["collscan"] else "ok"
+        print(f"{status:8} {result['name']}: {' <- '.join(result['stages'])}")
+        failed = failed or result["collscan"]
+    if failed:
+        raise SystemExit(1)
+
+
+async def cmd_rebuild_holdings(db, args):
+    await apply_indexes(db)
+    rebuilt = await rebuild_holdings(db, email=args.email, batch_size=args.batch_size)
+    print(f"Rebuilt {rebuilt} holdings")
+
+
+async def cmd_migrate_transaction_ids(db, args):
+    migrated = await migrate_legacy_ids(db, batch_size=args.batch_size)
+    print(f"Migrated {migrated} transaction IDs")
+
+
+async def cmd_open_ledgers(db, args):
+    await apply_indexes(db)
+    opened = await open_ledgers(db)
+    print(f"Opened {opened} wallet ledgers")
+
+
+async def cmd_verify_ledger(db, args):
+    report = await verify_ledger(db, email=args.email, batch_size=args.batch_size)
+    for problem in report["problems"]:
+        print(problem)
+    print(f"Replayed {report['entries']} entries across {report['wallets']} wallets and {report['snapshots']} snapshots")
+    if report["problems"]:
+        raise SystemExit(1)
+
+
+def settlement_rpc(args):
+    if args.local_rpc:
+        return LocalRpc(latency=args.rpc_latency)
+    return SorobanRpc(
+        os.environ['SOROBAN_RPC_URL'],
+        os.environ['SETTLEMENT_SECRET'],
+        os.environ['SETTLEMENT_CONTRACT_ID'],
+        os.environ['SETTLEMENT_PAYMENT_TOKEN'],
+        os.environ.get("SOROBAN_NETWORK_PASSPHRASE", "Test SDF Network ; September 2015")
+    )
+
+
+async def cmd_run_settlement(db, args):
+    await apply_indexes(db)
+    rpc = settlement_rpc(args)
+    worker = SettlementWorker(
+        db,
+        rpc,
+        bond_tokens=json.loads(os.environ.get("SETTLEMENT_BOND_TOKENS", "{}")),
+        batch_size=args.batch_size,
+        max_attempts=args.max_attempts
+    )
+    try:
+        if args.once:
+            while await worker.run_once() == args.batch_size:
+                pass
+        else:
+            await worker.run(interval=args.interval)
+    finally:
+        if hasattr(rpc, "close"):
+            await rpc.close()
+        print(f"Settlement: {worker.stats}")
+
+
+def contract_id(args) -> str:
+    return args.contract or os.environ['BOND_TOKEN_CONTRACT_ID']
+
+
+async def cmd_index_chain(db, args):
+    await apply_indexes(db)
+    if args.fixture:
+        source = FixtureSource(args.fixture)
+    else:
+        source = SorobanEventSource(os.environ['SOROBAN_RPC_URL'], start_ledger=args.start_ledger)
+    indexer = ChainIndexer(db, source, contract_id(args), batch_size=args.batch_size)
+    indexed = 0
+    try:
+        if args.once:
+            while True:
+                page = await indexer.run_once()
+                indexed += page
+                if page < args.batch_size:
+                    break
+        else:
+            await indexer.run(interval=args.interval)
+    finally:
+        if hasattr(source, "close"):
+            await source.close()
+        print(f"Indexed {indexed} events, cursor at {await indexer.cursor()}")
+
+
+async def cmd_reconcile_chain(db, args):
+    custody = args.custody or os.environ.get("SETTLEMENT_CUSTODY_ADDRESS")
+    mismatches = await reconcile(db, contract_id(args), args.bond_id, custody_address=custody)
+    for row in mismatches:
+        print(
+            f"{row['address']} ({row['email'] or 'unlinked'}): chain {row['chain_units']}, "
+            f"expected {row['expected_units']}, difference {row['difference']}"
+        )
+    print(f"{len(mismatches)} mismatched addresses")
+    if mismatches:
+        raise SystemExit(1)
+
+
+async def cmd_import_bonds(db, args):
+    await apply_indexes(db)
+    fmt = args.format or detect_format(args.file)
+    ingest = BondIngest(db, Bond, batch_size=args.batch_size)
+    async for event in ingest.run(parse_rows(iter_file_lines(args.file), fmt)):
+        if event["type"] == "error":
+            print(f"line {event['line']} ({event['id'] or 'no id'}): {event['detail']}", file=sys.stderr)
+        else:
+            label = "Imported" if event["type"] == "summary" else "Progress:"
+            print(
+                f"{label} {event['rows']} rows, {event['upserted']} new, {event['modified']} updated, "
+                f"{event['unchanged']} unchanged, {event['errors']} errors, {event['rows_per_second']} rows/s",
+                flush=True
+            )
+    if ingest.stats["errors"]:
+        raise SystemExit(1)
+
+
+async def cmd_ingest_quotes(db, args):
+    """Validate each line like POST /admin/bonds/quotes; bad lines are reported and skipped."""
+    await apply_indexes(db)
+    known_bonds = set(await db.bonds.distinct("id"))
+    totals = {"quotes": 0, "buckets": 0}
+    skipped = 0
+    batch = []
+    async for line_no, row, error in parse_rows(iter_file_lines(args.file), "jsonl"):
+        if error is None:
+            try:
+                quote = QuoteCreate(**row)
+            except ValidationError as exc:
+                error = validation_detail(exc)
+            else:
+                if quote.bond_id not in known_bonds:
+                    error = f"Unknown bond {quote.bond_id}"
+        if error is not None:
+            skipped += 1
+            print(f"line {line_no}: {error}", file=sys.stderr)
+            continue
+        batch.append(quote.model_dump())
+        if len(batch) >= args.batch_size:
+            result = await ingest_quotes(db, batch)
+            totals = {key: totals[key] + result[key] for key in totals}
+            batch = []
+    if batch:
+        result = await ingest_quotes(db, batch)
+        totals = {key: totals[key] + result[key] for key in totals}
+    print(f"Ingested {totals['quotes']} quotes into {totals['buckets']} bond-day bucket writes, skipped {skipped} lines")
+    if skipped:
+        raise SystemExit(1)
+
+
+async def cmd_reconcile_analytics(db, args):
+    while True:
+        drift = await analytics.reconcile(db, fix=args.fix)
+        for line in drift:
+            print(line)
+        action = "repaired" if args.fix and drift else "found"
+        print(f"Analytics counters: {len(drift)} discrepancies {action}", flush=True)
+        if not args.every:
+            break
+        await asyncio.sleep(args.every)
+    if drift and not args.fix:
+        raise SystemExit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="BondFi backend management commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    boot = commands.add_parser("bootstrap", help="Apply indexes and seed data once, under a Mongo lease")
+    boot.add_argument("--migrations", action="store_true", help="Also run the data migrations")
+    boot.add_argument("--wait", type=float, default=60.0, help="Seconds to wait for another bootstrap to finish")
+    boot.set_defaults(handler=cmd_bootstrap)
+
+    serve_parser = commands.add_parser("serve", help="Bootstrap once, then run the API with several worker processes")
+    serve_parser.add_argument("--host", default="0.0.0.0")
+    serve_parser.add_argument("--port", type=int, default=8001)
+    serve_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    serve_parser.add_argument("--log-level", default="info")
+    serve_parser.add_argument("--wait", type=float, default=60.0, help=argparse.SUPPRESS)
+    serve_parser.set_defaults(handler=cmd_serve)
+
+    ensure = commands.add_parser("ensure-indexes", help="Create every index in the index manifest")
+    ensure.set_defaults(handler=cmd_ensure_indexes)
+
+    check = commands.add_parser("check-indexes", help="Fail if any hot query plans a collection scan")
+    check.add_argument("--apply", action="store_true", help="Apply the index manifest first")
+    check.set_defaults(handler=cmd_check_indexes)
+
+    rebuild = commands.add_parser("rebuild-holdings", help="Backfill the holdings collection from transactions")
+    rebuild.add_argument("--email", help="Only rebuild holdings for this user")
+    rebuild.add_argument("--batch-size", type=int, default=500)
+    rebuild.set_defaults(handler=cmd_rebuild_holdings)
+
+    migrate_ids = commands.add_parser(
+        "migrate-transaction-ids", help="Rewrite legacy txn_<timestamp> IDs as time-sortable ULIDs"
+    )
+    migrate_ids.add_argument("--batch-size", type=int, default=500)
+    migrate_ids.set_defaults(handler=cmd_migrate_transaction_ids)
+
+    open_ledger = commands.add_parser(
+        "open-ledgers", help="Record an opening credit for wallets created before the ledger"
+    )
+    open_ledger.set_defaults(handler=cmd_open_ledgers)
+
+    verify = commands.add_parser("verify-ledger", help="Replay the wallet ledger and check snapshots and balances")
+    verify.add_argument("--email", help="Only verify this wallet")
+    verify.add_argument("--batch-size", type=int, default=5000)
+    verify.set_defaults(handler=cmd_verify_ledger)
+
+    settle = commands.add_parser("run-settlement", help="Settle queued purchases on-chain in batches")
+    settle.add_argument("--batch-size", type=int, default=500)
+    settle.add_argument("--max-attempts", type=int, default=5)
+    settle.add_argument("--interval", type=float, default=1.0, help="Seconds to wait when the queue is empty")
+    settle.add_argument("--once", action="store_true", help="Drain the due queue and exit")
+    settle.add_argument("--local-rpc", action="store_true", help="Use the in-process RPC stand-in")
+    settle.add_argument("--rpc-latency", type=float, default=0.05, help="Stand-in RPC latency in seconds")
+    settle.set_defaults(handler=cmd_run_settlement)
+
+    index_chain = commands.add_parser("index-chain", help="Tail bond-token contract events into Mongo")
+    index_chain.add_argument("--contract", help="Contract ID, defaults to BOND_TOKEN_CONTRACT_ID")
+    index_chain.add_argument("--fixture", help="Replay a recorded JSON-lines event file instead of RPC")
+    index_chain.add_argument("--start-ledger", type=int, default=0, help="First ledger when no cursor is stored")
+    index_chain.add_argument("--batch-size", type=int, default=1000)
+    index_chain.add_argument("--interval", type=float, default=5.0, help="Seconds to wait when caught up")
+    index_chain.add_argument("--once", action="store_true", help="Index until caught up and exit")
+    index_chain.set_defaults(handler=cmd_index_chain)
+
+    reconcile_chain = commands.add_parser(
+        "reconcile-chain", help="Compare indexed on-chain balances with off-chain holdings and settlements"
+    )
+    reconcile_chain.add_argument("--contract", help="Contract ID, defaults to BOND_TOKEN_CONTRACT_ID")
+    reconcile_chain.add_argument("--bond-id", action="append", required=True, help="Bond backed by this contract")
+    reconcile_chain.add_argument("--custody", help="Settlement custody address")
+    reconcile_chain.set_defaults(handler=cmd_reconcile_chain)
+
+    import_bonds = commands.add_parser("import-bonds", help="Upsert bonds from a CSV or JSON-lines file, streaming")
+    import_bonds.add_argument("file")
+    import_bonds.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+    import_bonds.add_argument("--batch-size", type=int, default=500)
+    import_bonds.set_defaults(handler=cmd_import_bonds)
+
+    quotes = commands.add_parser("ingest-quotes", help="Load bond yield and price quotes from a JSON-lines file")
+    quotes.add_argument("file", help="One {bond_id, timestamp, yield_percentage, price} object per line")
+    quotes.add_argument("--batch-size", type=int, default=10000)
+    quotes.set_defaults(handler=cmd_ingest_quotes)
+
+    reconcile_stats = commands.add_parser(
+        "reconcile-analytics", help="Recompute the admin analytics counters and compare them with the stored ones"
+    )
+    reconcile_stats.add_argument("--fix", action="store_true", help="Overwrite counters that drifted")
+    reconcile_stats.add_argument("--every", type=float, help="Keep running, reconciling every this many seconds")
+    reconcile_stats.set_defaults(handler=cmd_reconcile_analytics)
+
+    return parser
+
+
+async def run(args):
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        await args.handler(client[os.environ['DB_NAME']], args)
+    finally:
+        client.close()
+
+
+def main():
+    args = build_parser().parse_args()
+    asyncio.run(run(args))
+    if args.command == "serve":
+        serve(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Histogram:
+    """Fixed bucket array; observe() is a bisect and two integer increments, no locks."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class HistogramFamily:
+    def __init__(self, name: str, help_text: str, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.children = {}
+
+    def observe(self, value: float, *labels):
+        child = self.children.get(labels)
+        if child is None:
+            child = self.children.setdefault(labels, Histogram(self.buckets))
+        child.observe(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), list(child.counts)):
+                cumulative += count
+                le = _labels(self.label_names + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            base = _labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{base} {child.sum}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class CounterFamily:
+    def __init__(self, name: str, help_text: str, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = label_names
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in list(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.families = []
+        self.collectors = []
+
+    def histogram(self, *args, **kwargs) -> HistogramFamily:
+        family = HistogramFamily(*args, **kwargs)
+        self.families.append(family)
+        return family
+
+    def counter(self, *args, **kwargs) -> CounterFamily:
+        family = CounterFamily(*args, **kwargs)
+        self.families.append(family)
+        return family
+
+    def gauges(self, name: str, help_text: str, collect, label_names=()):
+        """Register gauges read at scrape time; collect() returns a number or {label_values: value}."""
+        self.collectors.append((name, help_text, label_names, collect))
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families:
+            lines.extend(family.render())
+        for name, help_text, label_names, collect in self.collectors:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            values = collect()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in values.items():
+                lines.append(f"{name}{_labels(label_names, labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_duration = registry.histogram(
+    "bondfi_http_request_duration_seconds", "API request latency by route", ("method", "route")
+)
+http_responses = registry.counter(
+    "bondfi_http_responses_total", "API responses by route and status", ("method", "route", "status")
+)
+mongo_duration = registry.histogram(
+    "bondfi_mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+mongo_failures = registry.counter(
+    "bondfi_mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+pool_checkout_wait = registry.histogram(
+    "bondfi_mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ("address",)
+)
+loop_lag = registry.histogram(
+    "bondfi_event_loop_lag_seconds", "Event-loop scheduling delay", (), buckets=LAG_BUCKETS
+)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency per matched /api route template."""
+
+    def __init__(self, app, prefix: str = "/api"):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            http_duration.observe(time.perf_counter() - started, scope["method"], path)
+            http_responses.inc(scope["method"], path, str(status_code))
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times every Mongo command using the driver's own duration_micros."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "-"
+        )
+
+    def _finish(self, event):
+        return self._collections.pop((event.connection_id, event.request_id), "-")
+
+    def succeeded(self, event):
+        mongo_duration.observe(event.duration_micros / 1e6, self._finish(event), event.command_name)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        mongo_duration.observe(event.duration_micros / 1e6, collection, event.command_name)
+        mongo_failures.inc(collection, event.command_name)
+
+
+class PoolTimer(monitoring.ConnectionPoolListener):
+    """Measures checkout wait; start and finish events fire on the same thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            pool_checkout_wait.observe(time.perf_counter() - started, f"{event.address[0]}:{event.address[1]}")
+            self._local.started = None
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+async def monitor_loop_lag(interval: float = 0.5):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        loop_lag.observe(max(loop.time() - expected, 0.0))
@@ -0,0 +1,126 @@
+import importlib.util
+import logging
+import os
+from typing import Optional
+
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from pymongo.write_concern import WriteConcern
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# Wire compressors and the optional module each one needs; zlib ships with Python.
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+def _int(env, name: str, default: int) -> int:
+    return int(env.get(name, default))
+
+
+class ConnectionProfile:
+    """Motor client options plus read/write routing, loaded from MONGO_* environment variables."""
+
+    def __init__(
+        self,
+        max_pool_size: int = 100,
+        min_pool_size: int = 0,
+        wait_queue_timeout_ms: int = 2000,
+        compressors: str = "zstd,snappy,zlib",
+        read_preference: str = "secondaryPreferred",
+        max_staleness_seconds: int = 90,
+        write_timeout_ms: int = 5000,
+        read_max_time_ms: int = 5000,
+        export_max_time_ms: int = 120000,
+        write_max_time_ms: int = 5000,
+    ):
+        if read_preference not in READ_PREFERENCES:
+            raise ValueError(f"Unknown read preference: {read_preference}")
+        if read_preference != "primary" and max_staleness_seconds not in (-1, 0) and max_staleness_seconds < 90:
+            raise ValueError("maxStalenessSeconds must be at least 90")
+        self.max_pool_size = max_pool_size
+        self.min_pool_size = min_pool_size
+        self.wait_queue_timeout_ms = wait_queue_timeout_ms
+        self.compressors = [name.strip() for name in compressors.split(",") if name.strip()]
+        self.read_preference_name = read_preference
+        self.max_staleness_seconds = max_staleness_seconds
+        self.write_timeout_ms = write_timeout_ms
+        self.max_time_ms = {
+            "read": read_max_time_ms or None,
+            "export": export_max_time_ms or None,
+            "write": write_max_time_ms or None,
+        }
+
+    @classmethod
+    def from_env(cls, env=os.environ) -> "ConnectionProfile":
+        return cls(
+            max_pool_size=_int(env, "MONGO_MAX_POOL_SIZE", 100),
+            min_pool_size=_int(env, "MONGO_MIN_POOL_SIZE", 0),
+            wait_queue_timeout_ms=_int(env, "MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000),
+            compressors=env.get("MONGO_COMPRESSORS", "zstd,snappy,zlib"),
+            read_preference=env.get("MONGO_READ_PREFERENCE", "secondaryPreferred"),
+            max_staleness_seconds=_int(env, "MONGO_MAX_STALENESS_SECONDS", 90),
+            write_timeout_ms=_int(env, "MONGO_WRITE_TIMEOUT_MS", 5000),
+            read_max_time_ms=_int(env, "MONGO_READ_MAX_TIME_MS", 5000),
+            export_max_time_ms=_int(env, "MONGO_EXPORT_MAX_TIME_MS", 120000),
+            write_max_time_ms=_int(env, "MONGO_WRITE_MAX_TIME_MS", 5000),
+        )
+
+    def available_compressors(self) -> list:
+        """Drop compressors whose module is missing instead of letting the driver warn on every connect."""
+        available = []
+        for name in self.compressors:
+            module = COMPRESSOR_MODULES.get(name)
+            if module and importlib.util.find_spec(module) is not None:
+                available.append(name)
+            else:
+                logger.info(f"Mongo wire compressor {name} unavailable, skipping")
+        return available
+
+    def client_kwargs(self) -> dict:
+        kwargs = {
+            "maxPoolSize": self.max_pool_size,
+            "minPoolSize": self.min_pool_size,
+            "waitQueueTimeoutMS": self.wait_queue_timeout_ms,
+        }
+        compressors = self.available_compressors()
+        if compressors:
+            kwargs["compressors"] = ",".join(compressors)
+        return kwargs
+
+    @property
+    def read_preference(self):
+        mode = READ_PREFERENCES[self.read_preference_name]
+        if mode is Primary:
+            return Primary()
+        return mode(max_staleness=self.max_staleness_seconds or -1)
+
+    @property
+    def wallet_write_concern(self) -> WriteConcern:
+        return WriteConcern(w="majority", wtimeout=self.write_timeout_ms or None)
+
+    def time_limit(self, operation: str) -> Optional[int]:
+        return self.max_time_ms[operation]
+
+    def write_options(self) -> dict:
+        """Extra findAndModify arguments; maxTimeMS is left out entirely when unlimited."""
+        limit = self.max_time_ms["write"]
+        return {"maxTimeMS": limit} if limit else {}
+
+    def read_database(self, db):
+        """Handle for catalog, quote and admin analytics reads, which tolerate bounded replication lag.
+
+        Reads of a user's own writes, such as transaction history, stay on the primary.
+        """
+        if self.read_preference_name == "primary":
+            return db
+        return db.with_options(read_preference=self.read_preference)
+
+    def wallets(self, db):
+        return db.get_collection("wallets", write_concern=self.wallet_write_concern)
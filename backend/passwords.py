@@ -0,0 +1,92 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+_contexts = {}
+
+
+def _context(rounds: int) -> CryptContext:
+    context = _contexts.get(rounds)
+    if context is None:
+        context = _contexts[rounds] = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+    return context
+
+
+def _hash(password: str, rounds: int) -> str:
+    return _context(rounds).hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str, rounds: int):
+    return _context(rounds).verify_and_update(password, hashed_password)
+
+
+def _timed(fn, *args):
+    return time.monotonic(), fn(*args)
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs bcrypt on a worker pool so hashing never blocks the event loop."""
+
+    def __init__(self, rounds: int = 12, workers: int = 4, max_pending: int = 64, executor: str = "thread"):
+        self.rounds = rounds
+        self.max_pending = max_pending
+        if executor == "process":
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated()
+        self._pending += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._pending)
+        queued_at = time.monotonic()
+        try:
+            started_at, result = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed, fn, *args
+            )
+        finally:
+            self._pending -= 1
+        finished_at = time.monotonic()
+        wait = max(started_at - queued_at, 0.0)
+        self.completed += 1
+        self.wait_seconds_total += wait
+        self.wait_seconds_max = max(self.wait_seconds_max, wait)
+        self.run_seconds_total += finished_at - started_at
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify_and_update(self, password: str, hashed_password: str):
+        """Return (valid, new_hash); new_hash is set when the stored cost differs from the configured one."""
+        return await self._run(_verify_and_update, password, hashed_password, self.rounds)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._pending,
+            "max_queue_depth": self.max_queue_depth,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "run_seconds_total": self.run_seconds_total,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,221 @@
+import math
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+
+import numpy as np
+from bson import Binary
+from pydantic import BaseModel
+from pymongo import ASCENDING, ReplaceOne
+from pymongo.errors import BulkWriteError
+
+INTERVALS = ("raw", "day", "week")
+SERIES = ("yield", "price")
+
+# How far back a query reaches when no start is given, and the widest raw range served
+DEFAULT_SPAN_DAYS = {"raw": 7, "day": 365, "week": 5 * 365}
+MAX_RAW_DAYS = 31
+
+SUMMARY_FIELDS = {"_id": 0, "day": 1, "count": 1, "yield": 1, "price": 1}
+POINT_FIELDS = {"_id": 0, "day": 1, "t": 1, "y": 1, "p": 1}
+
+
+class QuoteCreate(BaseModel):
+    bond_id: str
+    timestamp: datetime
+    yield_percentage: float
+    price: Optional[float] = None
+
+
+class InvalidRange(ValueError):
+    pass
+
+
+class IngestConflict(RuntimeError):
+    pass
+
+
+def parse_timestamp(value) -> datetime:
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def parse_range(start: Optional[str], end: Optional[str], interval: str, today: date) -> tuple:
+    if interval not in INTERVALS:
+        raise InvalidRange(f"Unknown interval {interval}, use {', '.join(INTERVALS)}")
+    try:
+        end_day = date.fromisoformat(end) if end else today
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=DEFAULT_SPAN_DAYS[interval] - 1)
+    except ValueError:
+        raise InvalidRange("Dates must be YYYY-MM-DD")
+    if start_day > end_day:
+        raise InvalidRange("start must not be after end")
+    if interval == "raw" and (end_day - start_day).days >= MAX_RAW_DAYS:
+        raise InvalidRange(f"Raw quotes are limited to {MAX_RAW_DAYS} days, use interval=day or week")
+    return start_day, end_day
+
+
+def _decode(bucket: Optional[dict]) -> tuple:
+    if bucket is None:
+        return np.empty(0, "<i4"), np.empty(0, "<f8"), np.empty(0, "<f8")
+    return (
+        np.frombuffer(bucket["t"], dtype="<i4"),
+        np.frombuffer(bucket["y"], dtype="<f8"),
+        np.frombuffer(bucket["p"], dtype="<f8"),
+    )
+
+
+def _summary(values: np.ndarray) -> Optional[dict]:
+    present = values[~np.isnan(values)]
+    if not present.size:
+        return None
+    return {
+        "open": float(present[0]),
+        "high": float(present.max()),
+        "low": float(present.min()),
+        "close": float(present[-1]),
+    }
+
+
+def build_bucket(bond_id: str, day: str, seconds: np.ndarray, yields: np.ndarray, prices: np.ndarray, rev: int) -> dict:
+    """One bond-day of quotes as packed little-endian columns plus its precomputed OHLC.
+
+    A point costs 20 bytes (int32 second of day, float64 yield and price) instead of a
+    document each, and daily or weekly queries read only the summaries.
+    """
+    return {
+        "bond_id": bond_id,
+        "day": day,
+        "rev": rev,
+        "count": int(seconds.size),
+        "t": Binary(seconds.astype("<i4").tobytes()),
+        "y": Binary(yields.astype("<f8").tobytes()),
+        "p": Binary(prices.astype("<f8").tobytes()),
+        "yield": _summary(yields),
+        "price": _summary(prices),
+    }
+
+
+def _merge(bucket: Optional[dict], seconds: list, yields: list, prices: list) -> tuple:
+    old_seconds, old_yields, old_prices = _decode(bucket)
+    merged = (
+        np.concatenate([old_seconds, np.asarray(seconds, dtype="<i4")]),
+        np.concatenate([old_yields, np.asarray(yields, dtype="<f8")]),
+        np.concatenate([old_prices, np.asarray(prices, dtype="<f8")]),
+    )
+    # Stable sort keeps arrival order within a second, so the newest quote for a timestamp wins
+    order = np.argsort(merged[0], kind="stable")
+    t, y, p = (column[order] for column in merged)
+    keep = np.append(t[1:] != t[:-1], True)
+    return t[keep], y[keep], p[keep]
+
+
+def group_quotes(quotes: list) -> dict:
+    """Group quotes into (bond_id, day) buckets of parallel second/yield/price lists."""
+    groups = {}
+    for quote in quotes:
+        moment = parse_timestamp(quote["timestamp"])
+        day = moment.date()
+        second = int((moment - datetime.combine(day, time(), timezone.utc)).total_seconds())
+        price = quote.get("price")
+        columns = groups.setdefault((quote["bond_id"], day.isoformat()), ([], [], []))
+        columns[0].append(second)
+        columns[1].append(float(quote["yield_percentage"]))
+        columns[2].append(math.nan if price is None else float(price))
+    return groups
+
+
+async def ingest_quotes(db, quotes: list, retries: int = 5) -> dict:
+    """Merge quotes into their bond-day buckets; re-ingesting a timestamp overwrites it.
+
+    Each bucket carries a revision and is replaced only if the revision it was read at
+    still matches. Concurrent writers then collide on the unique (bond_id, day) index
+    instead of overwriting each other, and the losing buckets are re-read and retried.
+    """
+    pending = group_quotes(quotes)
+    written = 0
+    for _ in range(retries):
+        if not pending:
+            break
+        days_by_bond = {}
+        for bond_id, day in pending:
+            days_by_bond.setdefault(bond_id, []).append(day)
+        existing = {
+            (bucket["bond_id"], bucket["day"]): bucket
+            async for bucket in db.bond_quotes.find({
+                "$or": [{"bond_id": bond_id, "day": {"$in": days}} for bond_id, days in days_by_bond.items()]
+            })
+        }
+        keys = list(pending)
+        ops = []
+        for key in keys:
+            bucket = existing.get(key)
+            rev = bucket["rev"] if bucket else 0
+            merged = _merge(bucket, *pending[key])
+            ops.append(ReplaceOne(
+                {"bond_id": key[0], "day": key[1], "rev": rev},
+                build_bucket(key[0], key[1], *merged, rev=rev + 1),
+                upsert=True
+            ))
+        conflicts = set()
+        try:
+            await db.bond_quotes.bulk_write(ops, ordered=False)
+        except BulkWriteError as exc:
+            if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+                raise
+            conflicts = {keys[error["index"]] for error in exc.details["writeErrors"]}
+        written += len(keys) - len(conflicts)
+        pending = {key: pending[key] for key in conflicts}
+    if pending:
+        raise IngestConflict(f"{len(pending)} quote buckets kept conflicting with concurrent writers")
+    return {"quotes": len(quotes), "buckets": written}
+
+
+def _combine(first: Optional[dict], later: Optional[dict]) -> Optional[dict]:
+    if first is None or later is None:
+        return first or later
+    return {
+        "open": first["open"],
+        "high": max(first["high"], later["high"]),
+        "low": min(first["low"], later["low"]),
+        "close": later["close"],
+    }
+
+
+def fold_weeks(days: list) -> list:
+    """Fold daily OHLC rows, in date order, into ISO weeks starting on Monday."""
+    weeks = {}
+    for row in days:
+        day = date.fromisoformat(row["date"])
+        week = (day - timedelta(days=day.weekday())).isoformat()
+        current = weeks.get(week)
+        if current is None:
+            weeks[week] = {**row, "date": week}
+            continue
+        current["count"] += row["count"]
+        for series in SERIES:
+            current[series] = _combine(current[series], row[series])
+    return list(weeks.values())
+
+
+async def quote_history(db, bond_id: str, start: date, end: date, interval: str = "day", max_time_ms: Optional[int] = None) -> list:
+    query = {"bond_id": bond_id, "day": {"$gte": start.isoformat(), "$lte": end.isoformat()}}
+    if interval == "raw":
+        points = []
+        cursor = db.bond_quotes.find(query, POINT_FIELDS, max_time_ms=max_time_ms).sort("day", ASCENDING)
+        async for bucket in cursor:
+            midnight = datetime.combine(date.fromisoformat(bucket["day"]), time(), timezone.utc)
+            seconds, yields, prices = _decode(bucket)
+            for second, yield_percentage, price in zip(seconds.tolist(), yields.tolist(), prices.tolist()):
+                points.append({
+                    "timestamp": (midnight + timedelta(seconds=second)).isoformat(),
+                    "yield_percentage": yield_percentage,
+                    "price": None if math.isnan(price) else price,
+                })
+        return points
+
+    buckets = await db.bond_quotes.find(query, SUMMARY_FIELDS, max_time_ms=max_time_ms).sort("day", ASCENDING).to_list(None)
+    days = [
+        {"date": bucket["day"], "count": bucket["count"], "yield": bucket["yield"], "price": bucket["price"]}
+        for bucket in buckets
+    ]
+    return fold_weeks(days) if interval == "week" else days
@@ -0,0 +1,156 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+from typing import Optional
+
+
+def parse_limit(spec: str) -> Optional[tuple]:
+    """'<burst>/<seconds>' -> (burst, tokens per second); 'off' or '' disables the class."""
+    spec = spec.strip()
+    if not spec or spec == "off":
+        return None
+    burst, _, period = spec.partition("/")
+    burst = float(burst)
+    period = float(period or 1)
+    if burst <= 0 or period <= 0:
+        raise ValueError(f"Invalid rate limit: {spec}")
+    return burst, burst / period
+
+
+class MemoryBucketStore:
+    """Token buckets in a plain dict, for a single worker process."""
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._buckets = {}
+
+    def take(self, key: str, burst: float, rate: float) -> float:
+        """Spend one token; return 0 when allowed, otherwise seconds until a token is available."""
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.maxsize:
+                self._evict(now)
+            tokens = burst
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate
+        self._buckets[key] = (tokens - 1, now)
+        return 0.0
+
+    def _evict(self, now: float):
+        # Buckets idle for a minute have refilled for any sane limit; fall back to the oldest insert
+        idle = [key for key, (_, updated) in self._buckets.items() if now - updated > 60]
+        for key in idle:
+            del self._buckets[key]
+        if len(self._buckets) >= self.maxsize:
+            del self._buckets[next(iter(self._buckets))]
+
+
+class SharedBucketStore:
+    """Token buckets in an mmap'd file shared by every worker on the host.
+
+    The file is a fixed table of (key hash, tokens, updated) slots addressed by open
+    addressing over a short probe window; a full window evicts its least recently
+    updated slot. An exclusive flock around each take keeps workers consistent.
+    """
+
+    SLOT = struct.Struct("<Qdd")
+    PROBES = 4
+
+    def __init__(self, path: str = "/dev/shm/bondfi-ratelimit", slots: int = 65536):
+        self.path = path
+        self.slots = slots
+        self._open()
+
+    def _open(self):
+        size = self.slots * self.SLOT.size
+        self._pid = os.getpid()
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != size:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.fstat(self._fd).st_size != size:
+                    os.ftruncate(self._fd, size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+
+    def _hash(self, key: str) -> int:
+        # Python's hash() is salted per process, so workers need a stable digest; 0 marks an empty slot
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def take(self, key: str, burst: float, rate: float) -> float:
+        if os.getpid() != self._pid:
+            # flock is held per open file, so a worker forked after import needs its own descriptor
+            self._open()
+        key_hash = self._hash(key)
+        start = key_hash % self.slots
+        now = time.time()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            victim, victim_updated, tokens = None, None, burst
+            for probe in range(self.PROBES):
+                offset = ((start + probe) % self.slots) * self.SLOT.size
+                slot_hash, slot_tokens, updated = self.SLOT.unpack_from(self._map, offset)
+                if slot_hash == key_hash:
+                    victim = offset
+                    tokens = min(burst, slot_tokens + max(now - updated, 0.0) * rate)
+                    break
+                if slot_hash == 0:
+                    victim, victim_updated = offset, -1.0
+                elif victim_updated is None or updated < victim_updated:
+                    victim, victim_updated = offset, updated
+            if tokens < 1:
+                self.SLOT.pack_into(self._map, victim, key_hash, tokens, now)
+                return (1 - tokens) / rate
+            self.SLOT.pack_into(self._map, victim, key_hash, tokens - 1, now)
+            return 0.0
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class RateLimited(Exception):
+    def __init__(self, route_class: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for {route_class}")
+        self.route_class = route_class
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Named limit classes, each a token bucket of (burst, refill rate) per key."""
+
+    def __init__(self, store, limits: dict):
+        self.store = store
+        self.limits = {name: parse_limit(spec) for name, spec in limits.items()}
+        self.rejected = {name: 0 for name in limits}
+
+    def check(self, route_class: str, key: str):
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return
+        retry_after = self.store.take(f"{route_class}:{key}", *limit)
+        if retry_after:
+            self.rejected[route_class] += 1
+            raise RateLimited(route_class, retry_after)
+
+    def close(self):
+        if hasattr(self.store, "close"):
+            self.store.close()
+
+
+def build_limiter(backend: str, limits: dict, path: Optional[str] = None, slots: int = 65536) -> RateLimiter:
+    if backend == "shared":
+        store = SharedBucketStore(path or "/dev/shm/bondfi-ratelimit", slots=slots)
+    else:
+        store = MemoryBucketStore(maxsize=slots)
+    return RateLimiter(store, limits)
@@ -0,0 +1,28 @@
+import json
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    """Serializes trusted payloads directly, skipping response_model validation and jsonable_encoder."""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def trusted_response(content, response: Response) -> FastJSONResponse:
+    """Build a FastJSONResponse carrying the headers already set on the injected response."""
+    return FastJSONResponse(content, headers=dict(response.headers))
@@ -1,38 +1,153 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import os
+import asyncio
+import hashlib
 import logging
+import math
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
 from typing import List, Optional
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 import jwt
 
+import analytics
+from bond_ingest import BondIngest, iter_lines, parse_rows
+from bootstrap import bootstrap
+from cache import LRUCache, ResponseCache, build_store
+from catalog import Bond, BondCatalog
+from events import EventHub, RedisBroker, format_sse
+from history import InvalidCursor, export_history, fetch_page
+from holdings import LOT_FIELDS, apply_buys, drop_emptied, get_user_holdings
+from idempotency import MAX_KEY_LENGTH, IdempotencyInProgress, IdempotencyMismatch, IdempotencyStore
+from ids import ULIDGenerator
+from mongo import ConnectionProfile
+from metrics import CommandTimer, MetricsMiddleware, PoolTimer, monitor_loop_lag, registry
+from ledger import WalletLedger, build_entry
+from passwords import PasswordHasher, PoolSaturated
+from quotes import IngestConflict, InvalidRange, QuoteCreate, ingest_quotes, parse_range, quote_history
+from ratelimit import RateLimited, build_limiter
+from responses import trusted_response
+from settlement import enqueue as enqueue_settlements, get_settlement
+from valuation import WINDOWS, InvalidWindow, value_portfolio
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+mongo_profile = ConnectionProfile.from_env()
+bootstrap_on_startup = os.environ.get("BOOTSTRAP_ON_STARTUP", "true").lower() == "true"
+
+# Created per worker in startup_db, never at import, so pre-fork servers don't share a pool
+client = None
+db = None
+read_db = None
+wallets = None
+
+def connect_mongo():
+    global client, db, read_db, wallets
+    client = AsyncIOMotorClient(
+        mongo_url,
+        event_listeners=[CommandTimer(), PoolTimer()],
+        **mongo_profile.client_kwargs()
+    )
+    db = client[os.environ['DB_NAME']]
+    read_db = mongo_profile.read_database(db)
+    wallets = mongo_profile.wallets(db)
+use_transactions = os.environ.get("MONGO_TRANSACTIONS", "false").lower() == "true"
+history_page_size = int(os.environ.get("HISTORY_PAGE_SIZE", "100"))
+history_max_page_size = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "500"))
+batch_order_max_items = int(os.environ.get("BATCH_ORDER_MAX_ITEMS", "50"))
+quote_ingest_max_items = int(os.environ.get("QUOTE_INGEST_MAX_ITEMS", "10000"))
+bond_import_batch_size = int(os.environ.get("BOND_IMPORT_BATCH_SIZE", "500"))
+bond_import_max_errors = int(os.environ.get("BOND_IMPORT_MAX_ERRORS", "1000"))
+portfolio_history_points = int(os.environ.get("PORTFOLIO_HISTORY_POINTS", "60"))
+fast_responses = os.environ.get("FAST_RESPONSES", "false").lower() == "true"
+settlement_enabled = os.environ.get("SETTLEMENT_ENABLED", "false").lower() == "true"
+idempotency_store = IdempotencyStore(
+    ttl=float(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400")),
+    lock_timeout=float(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "30")),
+    wait=float(os.environ.get("IDEMPOTENCY_WAIT_SECONDS", "10"))
+)
+admin_emails = {email.strip().lower() for email in os.environ.get("ADMIN_EMAILS", "").split(",") if email.strip()}
+transaction_ids = ULIDGenerator(prefix="txn_")
 
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+    workers=int(os.environ.get("PASSWORD_HASH_WORKERS", "4")),
+    max_pending=int(os.environ.get("PASSWORD_HASH_QUEUE", "64")),
+    executor=os.environ.get("PASSWORD_HASH_EXECUTOR", "thread")
+)
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 SECRET_KEY = os.environ.get("JWT_SECRET", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+token_cache = LRUCache(maxsize=int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000")))
+user_cache = LRUCache(
+    maxsize=int(os.environ.get("AUTH_USER_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("AUTH_USER_CACHE_TTL", "30"))
+)
+
+rate_limiter = build_limiter(
+    os.environ.get("RATE_LIMIT_STORE", "memory"),
+    {
+        "auth": os.environ.get("RATE_LIMIT_AUTH", "10/60"),
+        "money": os.environ.get("RATE_LIMIT_MONEY", "30/10"),
+    },
+    path=os.environ.get("RATE_LIMIT_SHARED_PATH"),
+    slots=int(os.environ.get("RATE_LIMIT_SLOTS", "65536"))
+)
+trust_forwarded_for = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+def client_ip(request: Request) -> str:
+    if trust_forwarded_for:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def enforce_limit(route_class: str, key: str):
+    try:
+        rate_limiter.check(route_class, key)
+    except RateLimited as exc:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please retry later",
+            headers={"Retry-After": str(math.ceil(exc.retry_after))}
+        )
+
+async def limit_by_ip(request: Request):
+    enforce_limit("auth", client_ip(request))
+
+def password_pool_busy():
+    logger.warning(f"Password hash pool saturated: {password_hasher.stats()}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PoolSaturated:
+        raise password_pool_busy()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str):
+    try:
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
+    except PoolSaturated:
+        raise password_pool_busy()
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -40,21 +155,55 @@ def create_access_token(data: dict):
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+def evict_user(email: str):
+    user_cache.delete(email)
+
+def decode_token(token: str) -> dict:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(digest)
+    if payload is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.InvalidTokenError:
             raise HTTPException(status_code=401, detail="Invalid token")
+        token_cache.set(digest, payload, expires_at=payload.get("exp"))
+    return payload
+
+async def load_user(token: str) -> dict:
+    payload = decode_token(token)
+    email: str = payload.get("sub")
+    if email is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    user = user_cache.get(email)
+    if user is None:
         user = await db.users.find_one({"email": email}, {"_id": 0})
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
-        return user
-    except jwt.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        user_cache.set(email, user)
+    return dict(user)
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await load_user(credentials.credentials)
+
+async def limit_money(current_user: dict = Depends(get_current_user)):
+    enforce_limit("money", current_user["email"])
+
+async def get_admin_user(current_user: dict = Depends(get_current_user)):
+    if current_user["email"].lower() not in admin_emails:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+async def get_stream_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    access_token: Optional[str] = None
+) -> str:
+    # EventSource cannot send headers, so streams also accept the token as a query parameter
+    token = credentials.credentials if credentials else access_token
+    if not token:
+        raise HTTPException(status_code=403, detail="Not authenticated")
+    return token
 
 class UserRegister(BaseModel):
     email: EmailStr
@@ -75,17 +224,28 @@ class AuthResponse(BaseModel):
     token: str
     user: User
 
-class Bond(BaseModel):
-    model_config = ConfigDict(extra="ignore")
-    id: str
-    country: str
-    country_code: str
-    yield_percentage: float
-    maturity_date: str
-    minimum_entry: float
-    flag_url: str
-    description: str
-    issuer: str
+portfolio_cache = ResponseCache(build_store(
+    os.environ.get("PORTFOLIO_CACHE_BACKEND", "memory"),
+    url=os.environ.get("PORTFOLIO_CACHE_URL"),
+    maxsize=int(os.environ.get("PORTFOLIO_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("PORTFOLIO_CACHE_TTL", "300")),
+    prefix="bondfi:portfolio:"
+))
+
+events_broker_url = os.environ.get("EVENTS_BROKER_URL")
+event_hub = EventHub(
+    queue_size=int(os.environ.get("EVENTS_QUEUE_SIZE", "64")),
+    broker=RedisBroker(events_broker_url) if events_broker_url else None
+)
+events_heartbeat = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+
+wallet_ledger = WalletLedger(snapshot_every=int(os.environ.get("LEDGER_SNAPSHOT_EVERY", "100")))
+
+bond_catalog = BondCatalog(
+    Bond,
+    ttl=float(os.environ.get("BOND_CACHE_TTL", "300")),
+    max_time_ms=mongo_profile.time_limit("read")
+)
 
 class Portfolio(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -114,13 +274,17 @@ class Transaction(BaseModel):
     timestamp: str
     transaction_type: str
 
-@api_router.post("/auth/register", response_model=AuthResponse)
+class BatchOrderResult(BaseModel):
+    total_amount: float
+    transactions: List[Transaction]
+
+@api_router.post("/auth/register", response_model=AuthResponse, dependencies=[Depends(limit_by_ip)])
 async def register(user_data: UserRegister):
     existing = await db.users.find_one({"email": user_data.email})
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password(user_data.password)
     user_doc = {
         "email": user_data.email,
         "password": hashed_pw,
@@ -128,12 +292,15 @@ async def register(user_data: UserRegister):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.users.insert_one(user_doc)
+    evict_user(user_data.email)
     
     wallet_doc = {
         "email": user_data.email,
-        "usdc_balance": 100.0
+        "usdc_balance": 100.0,
+        "ledger_seq": 1
     }
-    await db.wallets.insert_one(wallet_doc)
+    await wallets.insert_one(wallet_doc)
+    await wallet_ledger.append(db, build_entry(wallet_doc, "reward", wallet_doc["usdc_balance"], ["signup"]))
     
     token = create_access_token({"sub": user_data.email})
     return {
@@ -145,11 +312,17 @@ async def register(user_data: UserRegister):
         }
     }
 
-@api_router.post("/auth/login", response_model=AuthResponse)
+@api_router.post("/auth/login", response_model=AuthResponse, dependencies=[Depends(limit_by_ip)])
 async def login(login_data: UserLogin):
     user = await db.users.find_one({"email": login_data.email})
-    if not user or not verify_password(login_data.password, user["password"]):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_password(login_data.password, user["password"])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        await db.users.update_one({"email": user["email"]}, {"$set": {"password": new_hash}})
+        evict_user(user["email"])
     
     token = create_access_token({"sub": login_data.email})
     return {
@@ -162,134 +335,464 @@ async def login(login_data: UserLogin):
     }
 
 @api_router.get("/bonds", response_model=List[Bond])
-async def get_bonds():
-    bonds = await db.bonds.find({}, {"_id": 0}).to_list(100)
-    return bonds
+async def get_bonds(if_none_match: Optional[str] = Header(None)):
+    await bond_catalog.ensure_fresh(read_db)
+    headers = {"ETag": bond_catalog.etag, "Cache-Control": "no-cache"}
+    if bond_catalog.matches(if_none_match):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=bond_catalog.payload, media_type="application/json", headers=headers)
 
 @api_router.get("/bonds/{bond_id}", response_model=Bond)
 async def get_bond(bond_id: str):
-    bond = await db.bonds.find_one({"id": bond_id}, {"_id": 0})
+    await bond_catalog.ensure_fresh(read_db)
+    bond = bond_catalog.get(bond_id)
     if not bond:
         raise HTTPException(status_code=404, detail="Bond not found")
     return bond
 
+@api_router.get("/bonds/{bond_id}/history")
+async def get_bond_history(
+    bond_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    interval: str = "day"
+):
+    await bond_catalog.ensure_fresh(read_db)
+    if not bond_catalog.get(bond_id):
+        raise HTTPException(status_code=404, detail="Bond not found")
+    try:
+        start_day, end_day = parse_range(start, end, interval, datetime.now(timezone.utc).date())
+    except InvalidRange as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    points = await quote_history(
+        read_db, bond_id, start_day, end_day, interval, max_time_ms=mongo_profile.time_limit("read")
+    )
+    return {
+        "bond_id": bond_id,
+        "interval": interval,
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
+        "points": points
+    }
+
 @api_router.get("/portfolio", response_model=Portfolio)
-async def get_portfolio(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"email": current_user["email"], "transaction_type": "buy"},
-        {"_id": 0}
-    ).to_list(1000)
+async def get_portfolio(response: Response, window: str = "30d", current_user: dict = Depends(get_current_user)):
+    await bond_catalog.ensure_fresh(read_db)
+    # One field per named window, stamped with the day and catalog it was valued for, keeps
+    # each user's cache bounded; custom <N>d windows are valued on every request
+    cacheable = window in WINDOWS
+    stamp = f"{datetime.now(timezone.utc).date()}:{bond_catalog.version}"
+    cached, generation = await portfolio_cache.lookup(current_user["email"], window) if cacheable else (None, None)
+    if cached is not None and cached["stamp"] == stamp:
+        response.headers["X-Cache"] = "HIT"
+        portfolio = cached["portfolio"]
+        return trusted_response(portfolio, response) if fast_responses else portfolio
     
-    holdings_map = {}
-    for txn in transactions:
-        bond_id = txn["bond_id"]
-        if bond_id not in holdings_map:
-            bond = await db.bonds.find_one({"id": bond_id}, {"_id": 0})
-            holdings_map[bond_id] = {
-                "bond_id": bond_id,
-                "country": txn["bond_country"],
-                "tokens": 0,
-                "invested": 0,
-                "current_value": 0,
-                "yield_percentage": bond["yield_percentage"] if bond else 0
-            }
-        holdings_map[bond_id]["tokens"] += txn["tokens_received"]
-        holdings_map[bond_id]["invested"] += txn["amount"]
+    holdings = await get_user_holdings(db, current_user["email"])
+    
+    try:
+        valuation = value_portfolio(holdings, bond_catalog, window=window, max_points=portfolio_history_points)
+    except InvalidWindow:
+        raise HTTPException(status_code=400, detail="Invalid window, use 30d, 90d, 1y, inception or <N>d")
     
-    holdings = list(holdings_map.values())
     for holding in holdings:
-        holding["current_value"] = holding["invested"] * (1 + holding["yield_percentage"] / 100 * 0.5)
+        for field in LOT_FIELDS:
+            holding.pop(field, None)
+        bond = bond_catalog.get(holding["bond_id"])
+        holding["yield_percentage"] = bond["yield_percentage"] if bond else 0
+        holding["current_value"] = round(valuation["holdings"].get(holding["bond_id"], holding["invested"]), 2)
     
-    total_value = sum(h["current_value"] for h in holdings)
     total_tokens = sum(h["tokens"] for h in holdings)
     
-    earnings_history = []
-    for i in range(30):
-        date = (datetime.now(timezone.utc) - timedelta(days=29-i)).strftime("%Y-%m-%d")
-        value = total_value * (0.7 + (i / 30) * 0.3)
-        earnings_history.append({"date": date, "value": round(value, 2)})
-    
-    return {
-        "total_value": round(total_value, 2),
+    portfolio = {
+        "total_value": round(valuation["total_value"], 2),
         "total_tokens": round(total_tokens, 2),
         "holdings": holdings,
-        "earnings_history": earnings_history
+        "earnings_history": valuation["history"]
     }
+    if cacheable:
+        await portfolio_cache.set(current_user["email"], window, {"stamp": stamp, "portfolio": portfolio}, generation)
+    response.headers["X-Cache"] = "MISS" if cacheable else "BYPASS"
+    return trusted_response(portfolio, response) if fast_responses else portfolio
 
 @api_router.get("/wallet", response_model=Wallet)
 async def get_wallet(current_user: dict = Depends(get_current_user)):
-    wallet = await db.wallets.find_one({"email": current_user["email"]}, {"_id": 0})
+    wallet = await wallets.find_one({"email": current_user["email"]}, {"_id": 0})
     if not wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
     return wallet
 
-@api_router.post("/wallet/topup")
-async def topup_wallet(amount: float, current_user: dict = Depends(get_current_user)):
-    result = await db.wallets.update_one(
-        {"email": current_user["email"]},
-        {"$inc": {"usdc_balance": amount}}
+async def credit_wallet(email: str, amount: float, refs: Optional[list] = None, kind: str = "credit", session=None):
+    wallet = await wallets.find_one_and_update(
+        {"email": email},
+        {"$inc": {"usdc_balance": amount, "ledger_seq": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+        **mongo_profile.write_options()
     )
-    if result.modified_count == 0:
-        raise HTTPException(status_code=404, detail="Wallet not found")
-    
-    wallet = await db.wallets.find_one({"email": current_user["email"]}, {"_id": 0})
-    return {"message": "Top-up successful", "new_balance": wallet["usdc_balance"]}
+    if wallet is not None:
+        await wallet_ledger.append(db, build_entry(wallet, kind, amount, refs), session=session)
+    return wallet
 
-@api_router.post("/transactions/buy", response_model=Transaction)
-async def buy_bond(txn_data: TransactionCreate, current_user: dict = Depends(get_current_user)):
-    bond = await db.bonds.find_one({"id": txn_data.bond_id}, {"_id": 0})
-    if not bond:
-        raise HTTPException(status_code=404, detail="Bond not found")
-    
-    if txn_data.amount < bond["minimum_entry"]:
-        raise HTTPException(status_code=400, detail=f"Minimum entry is ${bond['minimum_entry']}")
-    
-    wallet = await db.wallets.find_one({"email": current_user["email"]})
-    if wallet["usdc_balance"] < txn_data.amount:
-        raise HTTPException(status_code=400, detail="Insufficient USDC balance")
-    
-    await db.wallets.update_one(
-        {"email": current_user["email"]},
-        {"$inc": {"usdc_balance": -txn_data.amount}}
+async def debit_wallet(email: str, amount: float, session=None):
+    """Reserve funds and bump ledger_seq; the caller appends the matching debit entry."""
+    return await wallets.find_one_and_update(
+        {"email": email, "usdc_balance": {"$gte": amount}},
+        {"$inc": {"usdc_balance": -amount, "ledger_seq": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+        **mongo_profile.write_options()
     )
-    
-    tokens = txn_data.amount
-    
-    txn_id = f"txn_{datetime.now(timezone.utc).timestamp()}"
-    transaction = {
-        "id": txn_id,
-        "email": current_user["email"],
-        "bond_id": txn_data.bond_id,
+
+def buy_amount_error(amount: float, bond: dict) -> Optional[str]:
+    # NaN compares false against the minimum entry, so it has to be rejected explicitly
+    if not math.isfinite(amount):
+        return "Amount must be a finite number"
+    if amount < bond["minimum_entry"]:
+        return f"Minimum entry is ${bond['minimum_entry']}"
+    return None
+
+def build_buy(email: str, bond: dict, amount: float) -> dict:
+    return {
+        "id": transaction_ids.new(),
+        "email": email,
+        "bond_id": bond["id"],
         "bond_country": bond["country"],
-        "amount": txn_data.amount,
-        "tokens_received": tokens,
+        "amount": amount,
+        "tokens_received": amount,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "transaction_type": "buy"
     }
-    await db.transactions.insert_one(transaction)
+
+async def queue_settlements(transactions: list, session=None):
+    if settlement_enabled:
+        await enqueue_settlements(db, transactions, session=session)
+
+async def update_holdings(transactions: list, session=None) -> list:
+    created = await apply_buys(db, transactions, session=session)
+    await analytics.record_holders(db, created, session=session)
+    return created
+
+async def record_buys(transactions: list, debit: dict):
+    inserted, applied, counted, posted = await asyncio.gather(
+        db.transactions.insert_many(transactions),
+        update_holdings(transactions),
+        analytics.record_buys(db, transactions),
+        wallet_ledger.append(db, debit),
+        return_exceptions=True
+    )
+    if isinstance(inserted, Exception):
+        await db.transactions.delete_many({"id": {"$in": [txn["id"] for txn in transactions]}})
+        await credit_wallet(transactions[0]["email"], -debit["amount"], refs=debit["refs"])
+        if not isinstance(applied, Exception):
+            await apply_buys(db, transactions, sign=-1)
+            await analytics.revert_holders(db, await drop_emptied(db, applied))
+        if not isinstance(counted, Exception):
+            await analytics.record_buys(db, transactions, sign=-1)
+        raise inserted
+    if isinstance(applied, Exception):
+        logger.error(f"Holdings update failed for {transactions[0]['id']}, run rebuild-holdings: {applied}")
+    if isinstance(counted, Exception):
+        logger.error(f"Analytics counters failed for {transactions[0]['id']}, run reconcile-analytics: {counted}")
+    if isinstance(posted, Exception):
+        logger.error(f"Ledger debit failed for {transactions[0]['id']}, run verify-ledger: {posted}")
+    # Queued only once the buys are recorded, so a rolled-back buy is never settled on-chain
+    try:
+        await queue_settlements(transactions)
+    except Exception as exc:
+        logger.error(f"Settlement enqueue failed for {transactions[0]['id']}: {exc}")
+
+async def publish_buys(email: str, wallet: dict, transactions: list):
+    deltas = {}
+    for txn in transactions:
+        delta = deltas.setdefault(txn["bond_id"], {"bond_id": txn["bond_id"], "tokens": 0, "invested": 0})
+        delta["tokens"] += txn["tokens_received"]
+        delta["invested"] += txn["amount"]
+    await event_hub.publish(email, {"type": "wallet", "usdc_balance": wallet["usdc_balance"]})
+    await event_hub.publish(email, {"type": "holdings", "deltas": list(deltas.values())})
+
+async def settle_buys(email: str, transactions: list):
+    total = sum(txn["amount"] for txn in transactions)
+    refs = [txn["id"] for txn in transactions]
+    if use_transactions:
+        async with await client.start_session() as session:
+            async with session.start_transaction():
+                wallet = await debit_wallet(email, total, session=session)
+                if wallet is None:
+                    raise HTTPException(status_code=400, detail="Insufficient USDC balance")
+                await db.transactions.insert_many(transactions, session=session)
+                await update_holdings(transactions, session=session)
+                await analytics.record_buys(db, transactions, session=session)
+                await wallet_ledger.append(db, build_entry(wallet, "debit", total, refs), session=session)
+                await queue_settlements(transactions, session=session)
+    else:
+        wallet = await debit_wallet(email, total)
+        if wallet is None:
+            raise HTTPException(status_code=400, detail="Insufficient USDC balance")
+        await record_buys(transactions, build_entry(wallet, "debit", total, refs))
+    await portfolio_cache.invalidate(email)
+    await publish_buys(email, wallet, transactions)
+
+async def idempotent(response: Response, email: str, key: Optional[str], route: str, payload, handler):
+    """Run a money-moving handler once per Idempotency-Key, replaying its stored response on retries."""
+    if key is None:
+        return await handler()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters")
+    try:
+        status_code, body, replayed = await idempotency_store.run(db, email, key, route, payload, handler)
+    except IdempotencyMismatch:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except IdempotencyInProgress:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "1"}
+        )
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    if status_code >= 400:
+        raise HTTPException(status_code=status_code, detail=body, headers=headers)
+    if headers:
+        response.headers.update(headers)
+    return body
+
+async def place_batch(items: List[TransactionCreate], current_user: dict) -> dict:
+    if not items:
+        raise HTTPException(status_code=400, detail="Order has no items")
+    if len(items) > batch_order_max_items:
+        raise HTTPException(status_code=400, detail=f"Order exceeds {batch_order_max_items} items")
+    
+    await bond_catalog.ensure_fresh(read_db)
+    bonds = []
+    errors = []
+    for index, item in enumerate(items):
+        bond = bond_catalog.get(item.bond_id)
+        if not bond:
+            errors.append({"index": index, "bond_id": item.bond_id, "detail": "Bond not found"})
+        elif buy_amount_error(item.amount, bond):
+            errors.append({"index": index, "bond_id": item.bond_id, "detail": buy_amount_error(item.amount, bond)})
+        bonds.append(bond)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+    
+    transactions = [build_buy(current_user["email"], bond, item.amount) for bond, item in zip(bonds, items)]
+    await settle_buys(current_user["email"], transactions)
+    
+    result = {"total_amount": sum(txn["amount"] for txn in transactions), "transactions": transactions}
+    return BatchOrderResult.model_validate(result).model_dump()
+
+@api_router.post("/wallet/topup", dependencies=[Depends(limit_money)])
+async def topup_wallet(
+    amount: float,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    # NaN slips past a <= 0 check and would poison the stored balance
+    if not math.isfinite(amount) or amount <= 0:
+        raise HTTPException(status_code=400, detail="Top-up amount must be a positive number")
+    
+    async def topup():
+        wallet = await credit_wallet(current_user["email"], amount)
+        if wallet is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+        await portfolio_cache.invalidate(current_user["email"])
+        await event_hub.publish(current_user["email"], {"type": "wallet", "usdc_balance": wallet["usdc_balance"]})
+        return {"message": "Top-up successful", "new_balance": wallet["usdc_balance"]}
     
-    return transaction
+    return await idempotent(response, current_user["email"], idempotency_key, "topup", {"amount": amount}, topup)
+
+@api_router.post("/transactions/buy", response_model=Transaction, dependencies=[Depends(limit_money)])
+async def buy_bond(
+    txn_data: TransactionCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    async def buy():
+        await bond_catalog.ensure_fresh(read_db)
+        bond = bond_catalog.get(txn_data.bond_id)
+        if not bond:
+            raise HTTPException(status_code=404, detail="Bond not found")
+        
+        error = buy_amount_error(txn_data.amount, bond)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+        
+        transaction = build_buy(current_user["email"], bond, txn_data.amount)
+        await settle_buys(current_user["email"], [transaction])
+        
+        return Transaction.model_validate(transaction).model_dump()
+    
+    return await idempotent(response, current_user["email"], idempotency_key, "buy", txn_data.model_dump(), buy)
+
+@api_router.post("/transactions/buy/batch", response_model=BatchOrderResult, dependencies=[Depends(limit_money)])
+async def buy_bonds_batch(
+    items: List[TransactionCreate],
+    response: Response,
+    idempotency_key: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
+):
+    payload = [item.model_dump() for item in items]
+    return await idempotent(
+        response, current_user["email"], idempotency_key, "buy-batch", payload, lambda: place_batch(items, current_user)
+    )
 
 @api_router.get("/transactions", response_model=List[Transaction])
-async def get_transactions(current_user: dict = Depends(get_current_user)):
-    transactions = await db.transactions.find(
-        {"email": current_user["email"]},
-        {"_id": 0}
-    ).sort("timestamp", -1).to_list(100)
-    return transactions
+async def get_transactions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    limit = min(limit or history_page_size, history_max_page_size)
+    try:
+        # A user's own history reads the primary so a buy that just returned is always listed
+        transactions, next_cursor = await fetch_page(
+            db, current_user["email"], limit, cursor, max_time_ms=mongo_profile.time_limit("read")
+        )
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return trusted_response(transactions, response) if fast_responses else transactions
+
+@api_router.get("/transactions/export")
+async def export_transactions(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_history(db, current_user["email"], format, max_time_ms=mongo_profile.time_limit("export")),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{format}"'}
+    )
+
+@api_router.get("/transactions/{txn_id}/settlement")
+async def get_transaction_settlement(txn_id: str, current_user: dict = Depends(get_current_user)):
+    transaction = await db.transactions.find_one({"id": txn_id, "email": current_user["email"]}, {"_id": 0, "id": 1})
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    settlement = await get_settlement(db, txn_id)
+    return settlement or {"txn_id": txn_id, "status": "unsettled"}
+
+@api_router.post("/admin/bonds/import", dependencies=[Depends(get_admin_user)])
+async def import_bonds(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    batch_size: int = Query(None, ge=1, le=10000)
+):
+    # The body is consumed as it arrives and only the first BOND_IMPORT_MAX_ERRORS row errors are kept
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "jsonl")
+    ingest = BondIngest(db, Bond, batch_size=batch_size or bond_import_batch_size)
+    errors = []
+    summary = None
+    async for event in ingest.run(parse_rows(iter_lines(request.stream()), fmt)):
+        if event["type"] == "error":
+            if len(errors) < bond_import_max_errors:
+                errors.append(event)
+        elif event["type"] == "progress":
+            logger.info(f"Bond import: {event['rows']} rows, {event['errors']} errors, {event['rows_per_second']} rows/s")
+        else:
+            summary = event
+    bond_catalog.invalidate()
+    summary.pop("type")
+    return {**summary, "errors_truncated": summary["errors"] > len(errors), "row_errors": errors}
+
+@api_router.post("/admin/bonds/quotes", dependencies=[Depends(get_admin_user)])
+async def post_bond_quotes(quotes: List[QuoteCreate]):
+    if len(quotes) > quote_ingest_max_items:
+        raise HTTPException(status_code=400, detail=f"Request exceeds {quote_ingest_max_items} quotes")
+    await bond_catalog.ensure_fresh(read_db)
+    unknown = sorted({quote.bond_id for quote in quotes if not bond_catalog.get(quote.bond_id)})
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown bonds: {', '.join(unknown)}")
+    try:
+        return await ingest_quotes(db, [quote.model_dump() for quote in quotes])
+    except IngestConflict as exc:
+        raise HTTPException(status_code=409, detail=str(exc), headers={"Retry-After": "1"})
+
+@api_router.get("/admin/analytics/aum", dependencies=[Depends(get_admin_user)])
+async def get_aum():
+    return await analytics.aum(read_db)
+
+@api_router.get("/admin/analytics/volume", dependencies=[Depends(get_admin_user)])
+async def get_daily_volume(days: int = Query(30, ge=1, le=366)):
+    return await analytics.daily_volume(read_db, days, datetime.now(timezone.utc).date())
+
+@api_router.get("/admin/analytics/holders", dependencies=[Depends(get_admin_user)])
+async def get_holders():
+    return await analytics.holders(read_db)
+
+@api_router.get("/events/stream")
+async def stream_events(token: str = Depends(get_stream_token)):
+    current_user = await load_user(token)
+    expires_at = decode_token(token).get("exp")
+
+    async def stream():
+        subscription = event_hub.subscribe(current_user["email"])
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                event = await subscription.get(timeout=events_heartbeat)
+                # A stream outlives the token that opened it, so close it once the token expires
+                if expires_at is not None and datetime.now(timezone.utc).timestamp() >= expires_at:
+                    yield format_sse({"type": "token_expired"})
+                    return
+                yield format_sse(event) if event else ": heartbeat\n\n"
+        finally:
+            event_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.get("/")
 async def root():
     return {"message": "Fractional Bond DApp API"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+registry.gauges(
+    "bondfi_password_pool", "bcrypt worker pool queue and wait statistics",
+    lambda: {(name,): value for name, value in password_hasher.stats().items()},
+    label_names=("stat",)
+)
+registry.gauges(
+    "bondfi_cache_lookups", "Cache hits and misses",
+    lambda: {
+        ("portfolio", "hit"): portfolio_cache.hits, ("portfolio", "miss"): portfolio_cache.misses,
+        ("auth_token", "hit"): token_cache.hits, ("auth_token", "miss"): token_cache.misses,
+        ("auth_user", "hit"): user_cache.hits, ("auth_user", "miss"): user_cache.misses,
+    },
+    label_names=("cache", "result")
+)
+registry.gauges(
+    "bondfi_rate_limited_requests", "Requests rejected by the rate limiter",
+    lambda: {(name,): count for name, count in rate_limiter.rejected.items()},
+    label_names=("route_class",)
+)
+registry.gauges("bondfi_event_stream_connections", "Open event stream connections", lambda: event_hub.connections)
+registry.gauges("bondfi_bond_catalog_version", "Bond catalog cache version", lambda: bond_catalog.version)
+
 app.include_router(api_router)
 
+app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Cache", "X-Next-Cursor"],
 )
 
 logging.basicConfig(
@@ -300,101 +803,21 @@ logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 async def startup_db():
-    bonds_count = await db.bonds.count_documents({})
-    if bonds_count == 0:
-        mock_bonds = [
-            {
-                "id": "bond_us_1",
-                "country": "United States",
-                "country_code": "US",
-                "yield_percentage": 4.2,
-                "maturity_date": "2028-12-31",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/us.png",
-                "description": "US Treasury bonds backed by the full faith of the United States government.",
-                "issuer": "U.S. Department of Treasury"
-            },
-            {
-                "id": "bond_sg_1",
-                "country": "Singapore",
-                "country_code": "SG",
-                "yield_percentage": 3.8,
-                "maturity_date": "2029-06-30",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/sg.png",
-                "description": "Singapore Government Securities with AAA credit rating.",
-                "issuer": "Monetary Authority of Singapore"
-            },
-            {
-                "id": "bond_de_1",
-                "country": "Germany",
-                "country_code": "DE",
-                "yield_percentage": 2.9,
-                "maturity_date": "2030-03-15",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/de.png",
-                "description": "German Bundesanleihen, considered one of the safest investments in Europe.",
-                "issuer": "Federal Republic of Germany"
-            },
-            {
-                "id": "bond_jp_1",
-                "country": "Japan",
-                "country_code": "JP",
-                "yield_percentage": 1.5,
-                "maturity_date": "2027-09-30",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/jp.png",
-                "description": "Japanese Government Bonds (JGBs) known for stability.",
-                "issuer": "Ministry of Finance Japan"
-            },
-            {
-                "id": "bond_ca_1",
-                "country": "Canada",
-                "country_code": "CA",
-                "yield_percentage": 3.5,
-                "maturity_date": "2029-11-15",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/ca.png",
-                "description": "Government of Canada bonds with strong credit rating.",
-                "issuer": "Government of Canada"
-            },
-            {
-                "id": "bond_au_1",
-                "country": "Australia",
-                "country_code": "AU",
-                "yield_percentage": 4.0,
-                "maturity_date": "2028-08-31",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/au.png",
-                "description": "Australian Government Bonds with attractive yields.",
-                "issuer": "Australian Office of Financial Management"
-            },
-            {
-                "id": "bond_uk_1",
-                "country": "United Kingdom",
-                "country_code": "GB",
-                "yield_percentage": 4.5,
-                "maturity_date": "2029-04-30",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/gb.png",
-                "description": "UK Gilts issued by Her Majesty's Treasury.",
-                "issuer": "UK Debt Management Office"
-            },
-            {
-                "id": "bond_ch_1",
-                "country": "Switzerland",
-                "country_code": "CH",
-                "yield_percentage": 1.8,
-                "maturity_date": "2030-12-31",
-                "minimum_entry": 1.0,
-                "flag_url": "https://flagcdn.com/w80/ch.png",
-                "description": "Swiss Confederation bonds, ultra-safe haven assets.",
-                "issuer": "Swiss Federal Finance Administration"
-            }
-        ]
-        await db.bonds.insert_many(mock_bonds)
-        logger.info("Mock bonds initialized")
+    connect_mongo()
+    if bootstrap_on_startup:
+        await bootstrap(db)
+    await bond_catalog.refresh(read_db)
+    bond_catalog.start_watching(read_db)
+    event_hub.start()
+    app.state.loop_lag_monitor = asyncio.create_task(monitor_loop_lag())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    app.state.loop_lag_monitor.cancel()
+    await bond_catalog.stop_watching()
+    password_hasher.shutdown()
+    await portfolio_cache.store.close()
+    await event_hub.close()
+    await wallet_ledger.close()
+    rate_limiter.close()
     client.close()
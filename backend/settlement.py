@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Optional
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SUBMITTING = "submitting"
+SUBMITTED = "submitted"
+SETTLED = "settled"
+FAILED = "failed"
+
+# Stellar asset contracts use 7 decimal places for i128 amounts
+TOKEN_DECIMALS = 7
+
+SETTLEMENT_FIELDS = {"_id": 0, "txn_id": 1, "status": 1, "attempts": 1, "tx_hash": 1, "error": 1, "settled_at": 1}
+
+
+class RpcError(Exception):
+    pass
+
+
+class RpcRejected(RpcError):
+    """The network refused the transaction outright, so it can never land and is safe to resend."""
+
+
+def to_units(amount: float) -> int:
+    return int((Decimal(str(amount)) * 10 ** TOKEN_DECIMALS).to_integral_value())
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # The Motor client is not tz_aware, so stored datetimes come back naive in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def build_settlements(transactions: list) -> list:
+    now = _now()
+    return [
+        {
+            "txn_id": txn["id"],
+            "email": txn["email"],
+            "bond_id": txn["bond_id"],
+            "units": to_units(txn["amount"]),
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        }
+        for txn in transactions
+    ]
+
+
+async def enqueue(db, transactions: list, session=None):
+    """Queue off-chain buys for settlement; re-queuing a transaction is a no-op."""
+    try:
+        await db.settlements.insert_many(build_settlements(transactions), ordered=False, session=session)
+    except BulkWriteError as exc:
+        if any(error["code"] != 11000 for error in exc.details["writeErrors"]):
+            raise
+
+
+async def get_settlement(db, txn_id: str) -> Optional[dict]:
+    return await db.settlements.find_one({"txn_id": txn_id}, SETTLEMENT_FIELDS)
+
+
+def _status(value) -> str:
+    # stellar-sdk reports statuses as Enums; compare on their string values
+    return str(getattr(value, "value", value))
+
+
+class LocalRpc:
+    """In-process stand-in for Soroban RPC with fixed submit and ledger-close latency.
+
+    Records every invocation so settlement throughput and batching can be measured
+    offline; failure_rate makes a share of submissions fail to exercise retries.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.05,
+        ledger_time: float = 0.0,
+        failure_rate: float = 0.0,
+        seed=None,
+        tx_timeout: int = 30
+    ):
+        self.latency = latency
+        self.ledger_time = ledger_time
+        self.failure_rate = failure_rate
+        self.tx_timeout = tx_timeout
+        self.invocations = []
+        self._results = {}
+        self._random = random.Random(seed)
+
+    async def submit(self, invocation: dict, before_send=None) -> str:
+        await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise RpcError("Simulated submission failure")
+        tx_hash = hashlib.sha256(f"{uuid.uuid4().hex}:{invocation['txn_ids']}".encode()).hexdigest()
+        if before_send is not None:
+            await before_send(tx_hash, _now() + timedelta(seconds=self.tx_timeout))
+        self.invocations.append(invocation)
+        self._results[tx_hash] = "SUCCESS"
+        return tx_hash
+
+    async def confirm(self, tx_hash: str, timeout: float) -> str:
+        await asyncio.sleep(self.ledger_time)
+        return self._results.get(tx_hash, "NOT_FOUND")
+
+
+class SorobanRpc:
+    """Invokes the marketplace buy_bond entry point from a custody account; needs the optional stellar-sdk package.
+
+    A Soroban transaction carries a single host-function invocation and the network
+    admits one pending transaction per source account, so submissions are serialised
+    on the account. Transactions expire after tx_timeout seconds, which keeps a
+    confirm timeout longer than that safe to retry.
+
+    The hash of the signed transaction is handed to before_send ahead of sending it,
+    so a caller that crashes mid-submit can look the transaction up instead of sending another.
+    """
+
+    def __init__(
+        self,
+        rpc_url: str,
+        secret: str,
+        contract_id: str,
+        payment_token: str,
+        network_passphrase: str,
+        tx_timeout: int = 30,
+        base_fee: int = 100
+    ):
+        try:
+            import stellar_sdk
+        except ImportError:
+            raise RuntimeError("The stellar-sdk package is required for Soroban settlement")
+        from stellar_sdk import SorobanServerAsync
+        from stellar_sdk.client.aiohttp_client import AiohttpClient
+
+        self._sdk = stellar_sdk
+        self._server = SorobanServerAsync(rpc_url, client=AiohttpClient())
+        self._keypair = stellar_sdk.Keypair.from_secret(secret)
+        self.contract_id = contract_id
+        self.payment_token = payment_token
+        self.network_passphrase = network_passphrase
+        self.tx_timeout = tx_timeout
+        self.base_fee = base_fee
+        self._lock = asyncio.Lock()
+
+    async def submit(self, invocation: dict, before_send=None) -> str:
+        scval = self._sdk.scval
+        async with self._lock:
+            expires_at = _now() + timedelta(seconds=self.tx_timeout)
+            account = await self._server.load_account(self._keypair.public_key)
+            tx = (
+                self._sdk.TransactionBuilder(account, self.network_passphrase, base_fee=self.base_fee)
+                .append_invoke_contract_function_op(
+                    self.contract_id,
+                    invocation["function"],
+                    [
+                        scval.to_address(self._keypair.public_key),
+                        scval.to_address(self.payment_token),
+                        scval.to_address(invocation["bond_token"]),
+                        scval.to_int128(invocation["amount"]),
+                    ]
+                )
+                .set_timeout(self.tx_timeout)
+                .build()
+            )
+            tx = await self._server.prepare_transaction(tx)
+            tx.sign(self._keypair)
+            if before_send is not None:
+                await before_send(tx.hash_hex(), expires_at)
+            response = await self._server.send_transaction(tx)
+            status = _status(response.status)
+            if status == "ERROR":
+                raise RpcRejected(f"Soroban RPC rejected transaction: {response.error_result_xdr}")
+            if status == "TRY_AGAIN_LATER":
+                # Not admitted, so the sequence number is unused and the batch can simply be retried
+                raise RpcRejected("Soroban RPC asked to try the transaction again later")
+            # Hold the account until the transaction leaves the mempool so the next sequence number is valid
+            await self.confirm(response.hash, self.tx_timeout * 2)
+            return response.hash
+
+    async def confirm(self, tx_hash: str, timeout: float) -> str:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            response = await self._server.get_transaction(tx_hash)
+            status = _status(response.status)
+            if status != "NOT_FOUND" or asyncio.get_running_loop().time() >= deadline:
+                return status
+            await asyncio.sleep(1)
+
+    async def close(self):
+        await self._server.close()
+
+
+class SettlementWorker:
+    """Claims due settlements in batches and folds each batch into one buy_bond invocation per bond.
+
+    Claims are leased, so several workers can share the queue and a crashed worker's
+    batch is picked up again once the lease expires. Each transaction's hash and expiry
+    are recorded on its purchases before it is sent, so a batch whose lease expired
+    mid-submit is re-checked by hash, and only resubmitted once that transaction has
+    expired without landing.
+    """
+
+    def __init__(
+        self,
+        db,
+        rpc,
+        bond_tokens: dict,
+        batch_size: int = 500,
+        max_attempts: int = 5,
+        backoff: float = 5.0,
+        lease: float = 300.0,
+        confirm_timeout: float = 60.0
+    ):
+        self.db = db
+        self.rpc = rpc
+        self.bond_tokens = bond_tokens
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self.confirm_timeout = confirm_timeout
+        self.stats = {"batches": 0, "invocations": 0, "settled": 0, "retried": 0, "failed": 0}
+
+    async def _release_expired(self):
+        """Requeue lapsed claims that never signed a transaction; re-check by hash those that did."""
+        expired = await self.db.settlements.find(
+            {"status": SUBMITTING, "claimed_at": {"$lt": _now() - timedelta(seconds=self.lease)}},
+            {"_id": 1, "tx_hash": 1, "claimed_at": 1}
+        ).to_list(None)
+        ops = [
+            UpdateOne(
+                {"_id": doc["_id"], "status": SUBMITTING},
+                {"$set": {"status": SUBMITTED, "submitted_at": doc["claimed_at"]}}
+                if doc.get("tx_hash") else {"$set": {"status": PENDING}}
+            )
+            for doc in expired
+        ]
+        if ops:
+            await self.db.settlements.bulk_write(ops, ordered=False)
+
+    async def _claim(self) -> list:
+        now = _now()
+        due = await self.db.settlements.find(
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"_id": 1}
+        ).sort("next_attempt_at", ASCENDING).limit(self.batch_size).to_list(self.batch_size)
+        if not due:
+            return []
+        batch_id = uuid.uuid4().hex
+        await self.db.settlements.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in due]}, "status": PENDING},
+            {"$set": {"status": SUBMITTING, "batch_id": batch_id, "claimed_at": now}}
+        )
+        return await self.db.settlements.find({"batch_id": batch_id, "status": SUBMITTING}).to_list(None)
+
+    async def _retry(self, docs: list, error: str, final: bool = False):
+        now = _now()
+        ops = []
+        for doc in docs:
+            attempts = doc["attempts"] + 1
+            if final or attempts >= self.max_attempts:
+                update = {"status": FAILED, "attempts": attempts, "error": error}
+                self.stats["failed"] += 1
+            else:
+                retry_at = now + timedelta(seconds=self.backoff * 2 ** (attempts - 1))
+                update = {"status": PENDING, "attempts": attempts, "error": error, "next_attempt_at": retry_at}
+                self.stats["retried"] += 1
+            change = {"$set": update}
+            if update["status"] == PENDING:
+                change["$unset"] = {"tx_hash": "", "tx_expires_at": ""}
+            ops.append(UpdateOne({"_id": doc["_id"]}, change))
+        if ops:
+            await self.db.settlements.bulk_write(ops, ordered=False)
+
+    async def _mark_settled(self, docs: list, tx_hash: str):
+        await self.db.settlements.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}},
+            {"$set": {"status": SETTLED, "tx_hash": tx_hash, "settled_at": _now()}, "$unset": {"error": ""}}
+        )
+        self.stats["settled"] += len(docs)
+
+    async def _record_hash(self, docs: list, tx_hash: str, expires_at: datetime):
+        result = await self.db.settlements.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}, "status": SUBMITTING, "batch_id": docs[0]["batch_id"]},
+            {"$set": {"tx_hash": tx_hash, "tx_expires_at": expires_at}}
+        )
+        if result.matched_count != len(docs):
+            # The lease lapsed and another worker owns some of these purchases now
+            raise RpcRejected("Settlement claim expired before sending")
+        for doc in docs:
+            doc["tx_hash"], doc["tx_expires_at"] = tx_hash, expires_at
+
+    async def _settle(self, invocation: dict, docs: list):
+        async def before_send(tx_hash: str, expires_at: datetime):
+            await self._record_hash(docs, tx_hash, expires_at)
+
+        try:
+            tx_hash = await self.rpc.submit(invocation, before_send)
+        except Exception as exc:
+            tx_hash = docs[0].get("tx_hash")
+            if tx_hash is None or isinstance(exc, RpcRejected):
+                logger.warning(f"Settlement submit failed for {len(docs)} purchases: {exc}")
+                await self._retry(docs, str(exc))
+                return
+            # Failed after the transaction may have gone out, so resolve it by hash instead of resending
+            logger.warning(f"Settlement submit of {tx_hash} ended without a response, will re-check: {exc}")
+        else:
+            self.stats["invocations"] += 1
+        await self.db.settlements.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}},
+            {"$set": {"status": SUBMITTED, "tx_hash": tx_hash, "submitted_at": _now()}}
+        )
+        await self._confirm(docs, tx_hash)
+
+    async def _confirm(self, docs: list, tx_hash: str):
+        try:
+            result = await self.rpc.confirm(tx_hash, self.confirm_timeout)
+        except Exception as exc:
+            logger.warning(f"Settlement confirm failed for {tx_hash}, will re-check: {exc}")
+            return
+        if result == "SUCCESS":
+            await self._mark_settled(docs, tx_hash)
+            return
+        expires_at = docs[0].get("tx_expires_at")
+        if result == "NOT_FOUND" and expires_at is not None and _now() < _aware(expires_at):
+            # Still inside its validity window, so it may yet land; resending could pay twice
+            logger.info(f"Settlement {tx_hash} not found before its expiry, will re-check")
+            return
+        await self._retry(docs, f"Transaction {tx_hash} {result}")
+
+    async def _recheck_submitted(self):
+        """Resolve purchases left in submitted by a crash or a confirm error."""
+        cutoff = _now() - timedelta(seconds=self.confirm_timeout)
+        stuck = await self.db.settlements.find(
+            {"status": SUBMITTED, "submitted_at": {"$lt": cutoff}}
+        ).limit(self.batch_size).to_list(self.batch_size)
+        by_hash = {}
+        for doc in stuck:
+            by_hash.setdefault(doc["tx_hash"], []).append(doc)
+        for tx_hash, docs in by_hash.items():
+            await self._confirm(docs, tx_hash)
+
+    async def run_once(self) -> int:
+        """Settle one batch; returns how many purchases were claimed."""
+        await self._release_expired()
+        await self._recheck_submitted()
+        docs = await self._claim()
+        if not docs:
+            return 0
+        self.stats["batches"] += 1
+
+        groups = {}
+        for doc in docs:
+            groups.setdefault(doc["bond_id"], []).append(doc)
+        settles = []
+        for bond_id, items in groups.items():
+            bond_token = self.bond_tokens.get(bond_id) or self.bond_tokens.get("*")
+            if bond_token is None:
+                await self._retry(items, f"No bond token configured for {bond_id}", final=True)
+                continue
+            invocation = {
+                "function": "buy_bond",
+                "bond_token": bond_token,
+                "amount": sum(item["units"] for item in items),
+                "txn_ids": [item["txn_id"] for item in items]
+            }
+            settles.append(self._settle(invocation, items))
+        await asyncio.gather(*settles)
+        return len(docs)
+
+    async def run(self, interval: float = 1.0):
+        while True:
+            try:
+                claimed = await self.run_once()
+            except Exception as exc:
+                logger.error(f"Settlement batch failed: {exc}")
+                claimed = 0
+            if claimed < self.batch_size:
+                await asyncio.sleep(interval)
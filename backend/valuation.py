@@ -0,0 +1,100 @@
+import re
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+WINDOWS = {"30d": 30, "90d": 90, "1y": 365, "inception": None}
+DAYS_PER_YEAR = 365.0
+EPOCH = np.datetime64("1970-01-01", "D")
+FAR_FUTURE = int(np.datetime64("9999-12-31", "D").astype(np.int64))
+
+
+class InvalidWindow(ValueError):
+    pass
+
+
+def parse_window(window: str) -> Optional[int]:
+    if window in WINDOWS:
+        return WINDOWS[window]
+    match = re.fullmatch(r"(\d{1,5})d", window)
+    if not match or int(match.group(1)) < 1:
+        raise InvalidWindow(window)
+    return int(match.group(1))
+
+
+def purchase_day(timestamp: str) -> int:
+    """Days since the Unix epoch of an ISO timestamp's calendar date."""
+    return int(np.datetime64(timestamp[:10], "D").astype(np.int64))
+
+
+LOT_DTYPE = [("holding", np.int64), ("principal", np.float64), ("rate", np.float64), ("start", np.int64), ("end", np.int64)]
+
+
+def build_lots(holdings: list, bonds: dict) -> dict:
+    """Expand holdings into one row per purchase-day lot: holding index, principal, rate, start and maturity day.
+
+    Holdings written before lots were recorded carry no lots; until rebuild-holdings
+    backfills them they are valued as one lot bought today, without accrual.
+    """
+    held = [holding for holding in holdings if holding.get("invested", 0) > 0]
+    today = datetime.now(timezone.utc).date().isoformat()
+
+    def rows():
+        for index, holding in enumerate(held):
+            bond = bonds.get(holding["bond_id"])
+            rate = bond["yield_percentage"] / 100 if bond else 0.0
+            end = purchase_day(bond["maturity_date"]) if bond else FAR_FUTURE
+            for day, amount in (holding.get("lots") or {today: holding["invested"]}).items():
+                if amount > 0:
+                    yield index, amount, rate, purchase_day(day), end
+
+    return {"bond_ids": [holding["bond_id"] for holding in held], "lots": np.fromiter(rows(), LOT_DTYPE)}
+
+
+def accrued_values(lots: np.ndarray, days: np.ndarray) -> np.ndarray:
+    """Simple-interest value of every lot on every day, shape (lots, days); zero before the lot was bought."""
+    start = lots["start"][:, None]
+    elapsed = days[None, :] - start
+    accrued = np.clip(elapsed, 0, np.maximum(lots["end"] - lots["start"], 0)[:, None])
+    values = lots["principal"][:, None] * (1.0 + lots["rate"][:, None] * accrued / DAYS_PER_YEAR)
+    return np.where(elapsed >= 0, values, 0.0)
+
+
+def sample_days(first: np.datetime64, last: np.datetime64, max_points: int) -> np.ndarray:
+    count = int((last - first).astype(np.int64)) + 1
+    if count <= max_points:
+        return first + np.arange(count)
+    offsets = np.unique(np.linspace(0, count - 1, max_points).round().astype(np.int64))
+    return first + offsets
+
+
+def value_portfolio(holdings: list, bonds: dict, window: str = "30d", max_points: int = 60, today=None) -> dict:
+    """Value each holding today and build a downsampled history for the requested window."""
+    window_days = parse_window(window)
+    today = np.datetime64(today or datetime.now(timezone.utc).date(), "D")
+    positions = build_lots(holdings, bonds)
+    lots = positions["lots"]
+    held = len(positions["bond_ids"])
+
+    if window_days is None:
+        first = EPOCH + int(lots["start"].min()) if lots.size else today
+    else:
+        first = today - (window_days - 1)
+    days = sample_days(min(first, today), today, max_points)
+
+    # Fold lot values into their holdings, then holdings into the portfolio series
+    values = np.zeros((held, len(days)))
+    if lots.size:
+        np.add.at(values, lots["holding"], accrued_values(lots, (days - EPOCH).astype(np.int64)))
+    series = values.sum(axis=0)
+    per_bond = values[:, -1]
+
+    return {
+        "holdings": dict(zip(positions["bond_ids"], per_bond.tolist())),
+        "total_value": float(per_bond.sum()),
+        "history": [
+            {"date": str(day), "value": round(value, 2)}
+            for day, value in zip(days.tolist(), series.tolist())
+        ],
+    }
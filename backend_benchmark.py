@@ -0,0 +1,451 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / "backend"
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, name, seconds, ok):
+        self.samples.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    @staticmethod
+    def percentile(sorted_samples, pct):
+        if not sorted_samples:
+            return 0.0
+        index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for name, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            endpoints[name] = {
+                "count": len(ordered),
+                "errors": self.errors.get(name, 0),
+                "rps": round(len(ordered) / elapsed, 2),
+                "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+                "p50_ms": round(self.percentile(ordered, 50) * 1000, 2),
+                "p95_ms": round(self.percentile(ordered, 95) * 1000, 2),
+                "p99_ms": round(self.percentile(ordered, 99) * 1000, 2),
+            }
+        total = sum(endpoint["count"] for endpoint in endpoints.values())
+        return {
+            "total_requests": total,
+            "total_errors": sum(self.errors.values()),
+            "rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser:
+    """Runs the register -> login -> top-up -> browse -> buy -> dashboard flow against the API."""
+
+    def __init__(self, client, recorder, bond_ids):
+        self.client = client
+        self.recorder = recorder
+        self.bond_ids = bond_ids
+        self.email = f"bench_{uuid.uuid4().hex[:12]}@example.com"
+        self.password = "BenchPass123!"
+        self.headers = {}
+
+    async def call(self, name, method, path, expected=200, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+            ok = response.status_code == expected
+        except Exception:
+            response, ok = None, False
+        self.recorder.record(name, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    async def sign_up(self):
+        response = await self.call(
+            "POST /auth/register", "POST", "/auth/register",
+            json={"email": self.email, "password": self.password, "name": "Bench User"}
+        )
+        if response is None:
+            return False
+        response = await self.call(
+            "POST /auth/login", "POST", "/auth/login",
+            json={"email": self.email, "password": self.password}
+        )
+        if response is None:
+            return False
+        self.headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        response = await self.call("POST /wallet/topup", "POST", "/wallet/topup", params={"amount": 100000})
+        return response is not None
+
+    async def iteration(self, index):
+        await self.call("GET /bonds", "GET", "/bonds")
+        await self.call(
+            "POST /transactions/buy", "POST", "/transactions/buy",
+            json={"bond_id": self.bond_ids[index % len(self.bond_ids)], "amount": 1.0}
+        )
+        await self.call("GET /portfolio", "GET", "/portfolio")
+        await self.call("GET /wallet", "GET", "/wallet")
+        await self.call("GET /transactions", "GET", "/transactions")
+
+
+async def run_load(base_url, users, iterations, duration):
+    import httpx
+
+    recorder = LatencyRecorder()
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=f"{base_url}/api", limits=limits, timeout=30) as client:
+        bonds = (await client.get("/bonds")).json()
+        bond_ids = [bond["id"] for bond in bonds] or ["bond_us_1"]
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def user_flow():
+            user = VirtualUser(client, recorder, bond_ids)
+            if not await user.sign_up():
+                return
+            index = 0
+            while index < iterations or deadline:
+                if deadline and time.perf_counter() >= deadline:
+                    break
+                await user.iteration(index)
+                index += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user_flow() for _ in range(users)))
+        elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed), elapsed
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port, mongo, workers):
+    env = dict(os.environ)
+    # Every virtual user shares one client IP, so the API's rate limits would throttle the run itself
+    env.setdefault("RATE_LIMIT_AUTH", "off")
+    env.setdefault("RATE_LIMIT_MONEY", "off")
+    if mongo == "memory":
+        command = [sys.executable, str(Path(__file__).resolve()), "serve-memory", "--port", str(port)]
+    else:
+        env["MONGO_URL"] = mongo
+        env["DB_NAME"] = env.get("BENCH_DB_NAME", f"bondfi_bench_{uuid.uuid4().hex[:8]}")
+        command = [
+            sys.executable, "manage.py", "serve",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning"
+        ]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                time.sleep(0.5)
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API server did not start within 30s")
+
+
+def serve_memory(port):
+    """Run server.py on an in-memory Mongo stand-in (needs the mongomock-motor package)."""
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    os.environ.setdefault("MONGO_URL", "mongodb://memory")
+    os.environ.setdefault("DB_NAME", "bondfi_bench")
+    # There is no replica set to route reads to, and the stand-in's with_options loses the async API
+    os.environ.setdefault("MONGO_READ_PREFERENCE", "primary")
+    sys.path.insert(0, str(BACKEND_DIR))
+    import uvicorn
+    import server
+
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def sample_payloads(transactions):
+    bond = {
+        "id": "bond_us_1", "country": "United States", "country_code": "US", "yield_percentage": 4.2,
+        "maturity_date": "2028-12-31", "minimum_entry": 1.0, "flag_url": "https://flagcdn.com/w80/us.png",
+        "description": "US Treasury bonds backed by the full faith of the United States government.",
+        "issuer": "U.S. Department of Treasury",
+    }
+    history = [
+        {
+            "id": f"txn_{i}", "email": "bench@example.com", "bond_id": "bond_us_1",
+            "bond_country": "United States", "amount": 10.0 + i, "tokens_received": 10.0 + i,
+            "timestamp": f"2025-01-01T00:00:{i % 60:02d}+00:00", "transaction_type": "buy",
+        }
+        for i in range(transactions)
+    ]
+    portfolio = {
+        "total_value": 1234.56,
+        "total_tokens": 1200.0,
+        "holdings": [
+            {"bond_id": f"bond_{i}", "country": "X", "tokens": 100.0, "invested": 100.0,
+             "yield_percentage": 4.2, "current_value": 102.88}
+            for i in range(8)
+        ],
+        "earnings_history": [{"date": f"2025-01-{i + 1:02d}", "value": 1000.0 + i} for i in range(30)],
+    }
+    return {"bonds": [bond] * 8, "transactions": history, "portfolio": portfolio}
+
+
+def benchmark_serialization(rounds, transactions):
+    """Compare FastAPI's validate + jsonable_encoder + json path with the trusted fast path, per request."""
+    from typing import List
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "bondfi_bench")
+    from responses import FastJSONResponse, orjson
+    from server import Bond, Portfolio, Transaction
+
+    models = {"bonds": List[Bond], "transactions": List[Transaction], "portfolio": Portfolio}
+    payloads = sample_payloads(transactions)
+    results = {}
+    for name, payload in payloads.items():
+        field = create_response_field(name=name, type_=models[name])
+
+        async def standard():
+            content = await serialize_response(field=field, response_content=payload, is_coroutine=True)
+            return JSONResponse(content).body
+
+        loop = asyncio.new_event_loop()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            loop.run_until_complete(standard())
+        standard_us = (time.perf_counter() - started) / rounds * 1e6
+        loop.close()
+
+        started = time.perf_counter()
+        for _ in range(rounds):
+            FastJSONResponse(payload).body
+        fast_us = (time.perf_counter() - started) / rounds * 1e6
+
+        results[name] = {
+            "standard_us": round(standard_us, 1),
+            "fast_us": round(fast_us, 1),
+            "saved_us": round(standard_us - fast_us, 1),
+            "speedup": round(standard_us / fast_us, 1) if fast_us else None,
+        }
+        print(f"{name:14} standard {standard_us:9.1f}us  fast {fast_us:8.1f}us  saved {standard_us - fast_us:9.1f}us/request")
+    print(f"Encoder: {'orjson' if orjson else 'json'}")
+    return results
+
+
+def compare(result, baseline, tolerance):
+    """Return the endpoints whose p95 latency, or the run whose throughput, regressed beyond the tolerance."""
+    regressions = []
+    for name, current in result["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous and previous["p95_ms"] and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+    if baseline.get("rps") and result["rps"] < baseline["rps"] * (1 - tolerance):
+        regressions.append(f"total: rps {baseline['rps']} -> {result['rps']}")
+    return regressions
+
+
+def print_report(result):
+    print(f"{'endpoint':28} {'count':>7} {'err':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, stats in result["endpoints"].items():
+        print(
+            f"{name:28} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>9} "
+            f"{stats['p50_ms']:>8}ms {stats['p95_ms']:>8}ms {stats['p99_ms']:>8}ms"
+        )
+    print(f"Total: {result['total_requests']} requests, {result['rps']} req/s, {result['total_errors']} errors")
+
+
+def benchmark_scaling(mongo, worker_counts, users, iterations, duration):
+    """Run the load flow against each worker count and report throughput relative to linear scaling."""
+    if mongo == "memory" and max(worker_counts) > 1:
+        raise SystemExit("Scaling needs --mongo <url>; the in-memory stand-in is private to each worker")
+    results = []
+    for workers in worker_counts:
+        port = free_port()
+        process = start_server(port, mongo, workers)
+        try:
+            result, elapsed = asyncio.run(run_load(f"http://127.0.0.1:{port}", users, iterations, duration))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        results.append({"workers": workers, "rps": result["rps"], "errors": result["total_errors"]})
+
+    per_worker = results[0]["rps"] / results[0]["workers"]
+    print(f"📈 Throughput scaling ({users} virtual users)")
+    for row in results:
+        row["efficiency"] = round(row["rps"] / (per_worker * row["workers"]), 3) if per_worker else 0.0
+        print(f"   {row['workers']:3d} workers  {row['rps']:9.1f} req/s  "
+              f"{row['efficiency']:.0%} of linear  {row['errors']} errors")
+    return results
+
+
+async def benchmark_settlement(purchases, bonds, batch_size, rpc_latency, ledger_time, failure_rate, mongo):
+    """Drain a synthetic settlement queue through the worker against the local RPC stand-in."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from indexes import apply_indexes
+    from settlement import FAILED, SETTLED, LocalRpc, SettlementWorker, enqueue
+
+    if mongo == "memory":
+        from mongomock_motor import AsyncMongoMockClient
+        client = AsyncMongoMockClient()
+    else:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        client = AsyncIOMotorClient(mongo)
+    db = client[f"bondfi_settlement_{uuid.uuid4().hex[:8]}"]
+    if mongo != "memory":
+        # The in-memory stand-in checks unique indexes with a full scan per updated document
+        await apply_indexes(db)
+
+    transactions = [
+        {"id": f"txn_bench_{i}", "email": f"user{i % 100}@example.com", "bond_id": f"bond_{i % bonds}", "amount": 10.0}
+        for i in range(purchases)
+    ]
+    for start in range(0, purchases, 1000):
+        await enqueue(db, transactions[start:start + 1000])
+
+    rpc = LocalRpc(latency=rpc_latency, ledger_time=ledger_time, failure_rate=failure_rate, seed=1)
+    worker = SettlementWorker(db, rpc, bond_tokens={"*": "CBENCHBONDTOKEN"}, batch_size=batch_size, backoff=0.0)
+    started = time.perf_counter()
+    while await db.settlements.count_documents({"status": {"$nin": [SETTLED, FAILED]}}):
+        await worker.run_once()
+    elapsed = time.perf_counter() - started
+    if mongo != "memory":
+        await client.drop_database(db.name)
+    client.close()
+
+    stats = worker.stats
+    print(f"🔗 Settled {stats['settled']}/{purchases} purchases in {elapsed:.2f}s "
+          f"({stats['settled'] / elapsed:.0f} purchases/s)")
+    print(f"   {stats['batches']} batches, {stats['invocations']} invocations "
+          f"({stats['settled'] / max(stats['invocations'], 1):.1f} purchases per invocation), "
+          f"{stats['retried']} retries, {stats['failed']} failed")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Load-test the BondFi API with concurrent virtual users")
+    commands = parser.add_subparsers(dest="command")
+
+    serve = commands.add_parser("serve-memory", help=argparse.SUPPRESS)
+    serve.add_argument("--port", type=int, required=True)
+
+    serialization = commands.add_parser("serialization", help="Measure per-request response serialization CPU")
+    serialization.add_argument("--rounds", type=int, default=2000)
+    serialization.add_argument("--transactions", type=int, default=100, help="Rows in the sample history page")
+
+    scaling = commands.add_parser("scaling", help="Measure throughput scaling across worker counts (MongoDB only)")
+    scaling.add_argument("--worker-counts", default="1,2,4", help="Comma-separated worker counts to run")
+
+    settlement = commands.add_parser("settlement", help="Measure settlement throughput against a stand-in RPC")
+    settlement.add_argument("--purchases", type=int, default=10000)
+    settlement.add_argument("--bonds", type=int, default=6, help="Distinct bonds across the purchases")
+    settlement.add_argument("--batch-size", type=int, default=500)
+    settlement.add_argument("--rpc-latency", type=float, default=0.05, help="Stand-in submit latency in seconds")
+    settlement.add_argument("--ledger-time", type=float, default=0.0, help="Stand-in confirmation delay in seconds")
+    settlement.add_argument("--failure-rate", type=float, default=0.0, help="Share of submissions that fail")
+
+    parser.add_argument("--base-url", help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--mongo", default="memory", help="'memory' for the in-memory stand-in, or a MongoDB URL")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (MongoDB only)")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--iterations", type=int, default=10, help="Flow iterations per virtual user")
+    parser.add_argument("--duration", type=float, help="Run for this many seconds instead of a fixed iteration count")
+    parser.add_argument("--output", help="Where to save the JSON results")
+    parser.add_argument("--baseline", help="Previous results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed regression ratio against the baseline")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    if args.command == "serve-memory":
+        serve_memory(args.port)
+        return 0
+    if args.command == "serialization":
+        benchmark_serialization(args.rounds, args.transactions)
+        return 0
+    if args.command == "scaling":
+        results = benchmark_scaling(
+            args.mongo, [int(count) for count in args.worker_counts.split(",")],
+            args.users, args.iterations, args.duration
+        )
+        output = Path(args.output or ROOT_DIR / "test_reports" / f"scaling_{datetime.now():%Y%m%d_%H%M%S}.json")
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps({"timestamp": datetime.now().isoformat(), "results": results}, indent=2))
+        print(f"📄 Results saved to {output}")
+        return 0
+    if args.command == "settlement":
+        asyncio.run(benchmark_settlement(
+            args.purchases, args.bonds, args.batch_size, args.rpc_latency,
+            args.ledger_time, args.failure_rate, args.mongo
+        ))
+        return 0
+
+    process = None
+    base_url = args.base_url
+    if not base_url:
+        port = free_port()
+        process = start_server(port, args.mongo, args.workers)
+        base_url = f"http://127.0.0.1:{port}"
+
+    try:
+        print(f"🚀 Benchmarking {base_url} with {args.users} virtual users")
+        result, elapsed = asyncio.run(run_load(base_url, args.users, args.iterations, args.duration))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=10)
+
+    result.update({
+        "timestamp": datetime.now().isoformat(),
+        "duration_s": round(elapsed, 3),
+        "config": {
+            "base_url": args.base_url,
+            "mongo": "external" if args.base_url else ("memory" if args.mongo == "memory" else "mongodb"),
+            "workers": args.workers,
+            "users": args.users,
+            "iterations": args.iterations,
+            "duration": args.duration,
+        },
+    })
+    print_report(result)
+
+    output = Path(args.output or ROOT_DIR / "test_reports" / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print(f"📄 Results saved to {output}")
+
+    if args.baseline:
+        regressions = compare(result, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"⚠️  Regression: {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import requests
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 class BondDAppAPITester:
@@ -265,6 +266,41 @@ class BondDAppAPITester:
         
         return success, response
 
+    def test_concurrent_buys(self, bond_id="bond_us_1", parallel=20):
+        """Test that parallel buys can never overdraw the wallet"""
+        success, balance = self.test_wallet()
+        if not success or balance <= 0:
+            self.log_test("Concurrent Buys", False, "No wallet balance to spend")
+            return False
+        
+        amount = round(balance / 4 + 0.01, 2)
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        
+        def buy(_):
+            try:
+                return requests.post(
+                    f"{self.api_url}/transactions/buy",
+                    json={"bond_id": bond_id, "amount": amount},
+                    headers=headers,
+                    timeout=30
+                ).status_code
+            except requests.exceptions.RequestException:
+                return None
+        
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            statuses = list(pool.map(buy, range(parallel)))
+        
+        bought = statuses.count(200)
+        success, final_balance = self.test_wallet()
+        expected = round(balance - bought * amount, 2)
+        ok = success and bought <= 3 and final_balance >= 0 and abs(final_balance - expected) < 0.01
+        self.log_test(
+            "Concurrent Buys",
+            ok,
+            f"{bought}/{parallel} buys of ${amount} accepted, balance ${balance} -> ${final_balance}"
+        )
+        return ok
+
     def test_authentication_required(self):
         """Test that protected endpoints require authentication"""
         # Temporarily remove token
@@ -324,6 +360,9 @@ class BondDAppAPITester:
                 # Test transaction history
                 self.test_get_transactions()
         
+            # Test that parallel purchases cannot overdraw the wallet
+            self.test_concurrent_buys(bonds[0]['id'])
+        
         # Test authentication
         self.test_authentication_required()
         
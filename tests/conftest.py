@@ -0,0 +1,68 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1] / "backend"
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Fast hashing, no rate limits and primary reads; mongomock has no replica set to route to
+os.environ.update({
+    "MONGO_URL": "mongodb://localhost:27017",
+    "DB_NAME": "bondfi_test",
+    "BCRYPT_ROUNDS": "4",
+    "RATE_LIMIT_AUTH": "off",
+    "RATE_LIMIT_MONEY": "off",
+    "MONGO_READ_PREFERENCE": "primary",
+    "ADMIN_EMAILS": "admin@example.com",
+})
+
+import mongomock.collection  # noqa: E402
+import mongomock_motor  # noqa: E402
+import motor.motor_asyncio  # noqa: E402
+from pymongo import ReturnDocument  # noqa: E402
+
+motor.motor_asyncio.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+_find_and_modify = mongomock.collection.Collection._find_and_modify
+
+
+def _find_and_modify_by_id(self, query, projection=None, update=None, upsert=False, sort=None,
+                           return_document=ReturnDocument.BEFORE, session=None, **kwargs):
+    # mongomock re-reads the AFTER document with the original filter unless the projection
+    # keeps _id, so a guard like {"usdc_balance": {"$gte": amount}} makes it return None
+    match = self.find_one(query, {"_id": 1}, sort=sort)
+    if match is not None:
+        query = {"_id": match["_id"]}
+    return _find_and_modify(self, query, projection, update, upsert, sort, return_document, session, **kwargs)
+
+
+mongomock.collection.Collection._find_and_modify = _find_and_modify_by_id
+
+
+@pytest.fixture
+def mock_db():
+    return mongomock_motor.AsyncMongoMockClient()["bondfi_test"]
+
+
+@pytest.fixture(scope="session")
+def api():
+    """One app lifecycle per session: shutdown closes the password hashing pool for good."""
+    from fastapi.testclient import TestClient
+
+    import server
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+@pytest.fixture
+def register(api):
+    def register(email: str) -> dict:
+        response = api.post("/api/auth/register", json={"email": email, "password": "pw12345", "name": "Test"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['token']}"}
+
+    return register
@@ -0,0 +1,33 @@
+import pytest
+
+
+@pytest.mark.parametrize("amount", ["nan", "inf", "-inf", "0", "-5"])
+def test_topup_rejects_non_finite_and_non_positive_amounts(api, register, amount):
+    headers = register(f"topup-{amount}@example.com")
+    before = api.get("/api/wallet", headers=headers).json()["usdc_balance"]
+
+    response = api.post(f"/api/wallet/topup?amount={amount}", headers=headers)
+
+    assert response.status_code == 400
+    wallet = api.get("/api/wallet", headers=headers).json()
+    assert wallet["usdc_balance"] == before
+    # The wallet still works afterwards
+    assert api.post("/api/wallet/topup?amount=5", headers=headers).status_code == 200
+
+
+@pytest.mark.parametrize("amount", ["NaN", "Infinity"])
+def test_buy_rejects_non_finite_amounts(api, register, amount):
+    headers = {**register(f"buy-{amount}@example.com"), "Content-Type": "application/json"}
+    before = api.get("/api/wallet", headers=headers).json()["usdc_balance"]
+
+    single = api.post(
+        "/api/transactions/buy", content=f'{{"bond_id": "bond_us_1", "amount": {amount}}}', headers=headers
+    )
+    batch = api.post(
+        "/api/transactions/buy/batch", content=f'[{{"bond_id": "bond_us_1", "amount": {amount}}}]', headers=headers
+    )
+
+    assert single.status_code == 400
+    assert single.json()["detail"] == "Amount must be a finite number"
+    assert batch.status_code == 400
+    assert api.get("/api/wallet", headers=headers).json()["usdc_balance"] == before
@@ -0,0 +1,69 @@
+import asyncio
+from datetime import date
+
+import analytics
+from holdings import apply_buys, drop_emptied
+from indexes import apply_indexes
+
+
+def buy(txn_id: str, email: str, bond_id: str, amount: float) -> dict:
+    return {
+        "id": txn_id,
+        "email": email,
+        "bond_id": bond_id,
+        "bond_country": "X",
+        "amount": amount,
+        "tokens_received": amount,
+        "timestamp": "2026-10-17T09:30:00+00:00",
+        "transaction_type": "buy",
+    }
+
+
+def test_imported_bond_ids_with_dots_and_dollars_count_per_day(mock_db):
+    transactions = [
+        buy("txn_1", "a@example.com", "ust.2030", 40.0),
+        buy("txn_2", "b@example.com", "$eur.bund", 10.0),
+        buy("txn_3", "a@example.com", "ust.2030", 5.0),
+    ]
+
+    async def scenario():
+        await apply_indexes(mock_db)
+        await mock_db.transactions.insert_many([dict(txn) for txn in transactions])
+        await analytics.record_buys(mock_db, transactions)
+        volume = await analytics.daily_volume(mock_db, 1, date(2026, 10, 17))
+        return volume, await analytics.reconcile(mock_db)
+
+    volume, drift = asyncio.run(scenario())
+    assert volume == [{
+        "date": "2026-10-17",
+        "amount": 55.0,
+        "buys": 3,
+        "by_bond": {"ust.2030": 45.0, "$eur.bund": 10.0},
+    }]
+    assert drift == []
+
+
+def test_reverting_a_failed_first_buy_drops_the_holder(mock_db):
+    existing = buy("txn_1", "a@example.com", "bond_us_1", 20.0)
+    failed = [buy("txn_2", "a@example.com", "bond_sg_1", 10.0), buy("txn_3", "c@example.com", "bond_sg_1", 10.0)]
+
+    async def scenario():
+        await mock_db.transactions.insert_one(dict(existing))
+        await analytics.record_holders(mock_db, await apply_buys(mock_db, [existing]))
+        await analytics.record_buys(mock_db, [existing])
+
+        created = await apply_buys(mock_db, failed)
+        await analytics.record_holders(mock_db, created)
+        # The compensation path in server.record_buys after the transaction insert failed
+        await apply_buys(mock_db, failed, sign=-1)
+        await analytics.revert_holders(mock_db, await drop_emptied(mock_db, created))
+        return (
+            await analytics.holders(mock_db),
+            await mock_db.holdings.count_documents({}),
+            await analytics.reconcile(mock_db),
+        )
+
+    holders, holding_count, drift = asyncio.run(scenario())
+    assert holders == {"unique_holders": 1, "by_bond": {"bond_us_1": 1, "bond_sg_1": 0}}
+    assert holding_count == 1
+    assert drift == []
@@ -0,0 +1,23 @@
+import asyncio
+
+from bootstrap import BOOTSTRAP_VERSION, bootstrap
+from indexes import manifest_hash
+
+
+def test_new_indexes_are_applied_on_an_already_seeded_deployment(mock_db):
+    async def scenario():
+        # A deployment bootstrapped before the manifest hash was recorded
+        await mock_db.meta.insert_one({"_id": "bootstrap", "version": BOOTSTRAP_VERSION})
+        applied = await bootstrap(mock_db, holder="test")
+        indexes = await mock_db.idempotency_keys.index_information()
+        state = await mock_db.meta.find_one({"_id": "bootstrap"})
+        again = await bootstrap(mock_db, holder="test")
+        return applied, indexes, state, again, await mock_db.bonds.count_documents({})
+
+    applied, indexes, state, again, bonds = asyncio.run(scenario())
+    assert applied
+    assert "email_key_unique" in indexes
+    assert state["indexes"] == manifest_hash()
+    assert not again
+    # Seeding stays gated on the version, so an existing catalog is not re-seeded
+    assert bonds == 0
@@ -0,0 +1,25 @@
+import mongomock_motor
+import pytest
+
+
+def test_failed_insert_rolls_back_without_queuing_settlement(api, register, monkeypatch):
+    import server
+
+    headers = register("rollback@example.com")
+    before = api.get("/api/wallet", headers=headers).json()["usdc_balance"]
+    insert_many = mongomock_motor.AsyncMongoMockCollection.insert_many
+
+    async def failing_insert(self, documents, *args, **kwargs):
+        if self.name == "transactions":
+            raise RuntimeError("primary stepped down")
+        return await insert_many(self, documents, *args, **kwargs)
+
+    monkeypatch.setattr(server, "settlement_enabled", True)
+    monkeypatch.setattr(mongomock_motor.AsyncMongoMockCollection, "insert_many", failing_insert)
+    with pytest.raises(RuntimeError):
+        api.post("/api/transactions/buy", json={"bond_id": "bond_us_1", "amount": 10.0}, headers=headers)
+    monkeypatch.undo()
+
+    assert api.get("/api/wallet", headers=headers).json()["usdc_balance"] == before
+    assert api.portal.call(server.db.settlements.count_documents, {"email": "rollback@example.com"}) == 0
+    assert api.portal.call(server.db.holdings.count_documents, {"email": "rollback@example.com"}) == 0
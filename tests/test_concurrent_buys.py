@@ -0,0 +1,31 @@
+import asyncio
+
+import httpx
+
+
+def test_concurrent_buys_never_overdraw(api, register):
+    import server
+
+    headers = register("concurrent-buys@example.com")
+    balance = api.get("/api/wallet", headers=headers).json()["usdc_balance"]
+    amount = 30.0
+    affordable = int(balance // amount)
+
+    async def burst():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/api/transactions/buy", json={"bond_id": "bond_us_1", "amount": amount}, headers=headers)
+                for _ in range(10)
+            ])
+
+    responses = api.portal.call(burst)
+    statuses = [response.status_code for response in responses]
+
+    assert statuses.count(200) == affordable
+    assert statuses.count(400) == len(statuses) - affordable
+    wallet = api.get("/api/wallet", headers=headers).json()
+    assert wallet["usdc_balance"] >= 0
+    assert wallet["usdc_balance"] == balance - affordable * amount
+    history = api.get("/api/transactions", headers=headers).json()
+    assert len(history) == affordable
@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta, timezone
+
+import jwt
+
+from events import RESYNC, EventHub
+
+
+def test_stream_closes_once_query_token_expires(api, register, monkeypatch):
+    import server
+
+    register("stream-expiry@example.com")
+    token = jwt.encode(
+        {"sub": "stream-expiry@example.com", "exp": datetime.now(timezone.utc) + timedelta(seconds=2)},
+        server.SECRET_KEY,
+        algorithm=server.ALGORITHM
+    )
+    monkeypatch.setattr(server, "events_heartbeat", 0.2)
+
+    with api.stream("GET", "/api/events/stream", params={"access_token": token}) as response:
+        assert response.status_code == 200
+        body = "".join(response.iter_text())
+
+    assert ": heartbeat" in body
+    assert body.rstrip().endswith('data: {"type":"token_expired"}')
+
+
+def test_resync_reaches_every_local_stream():
+    hub = EventHub()
+    first = hub.subscribe("a@example.com")
+    second = hub.subscribe("b@example.com")
+    hub.resync()
+    assert first.queue.get_nowait() == RESYNC
+    assert second.queue.get_nowait() == RESYNC
@@ -0,0 +1,92 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from holdings import apply_buys, get_user_holdings, rebuild_holdings
+from valuation import value_portfolio
+
+BONDS = {
+    "bond_us_1": {"id": "bond_us_1", "yield_percentage": 4.2, "maturity_date": "2028-12-31"},
+    "bond_sg_1": {"id": "bond_sg_1", "yield_percentage": 3.8, "maturity_date": "2027-06-30"},
+}
+
+
+def buy(txn_id: str, bond_id: str, amount: float, day: str) -> dict:
+    return {
+        "id": txn_id,
+        "email": "lots@example.com",
+        "bond_id": bond_id,
+        "bond_country": "X",
+        "amount": amount,
+        "tokens_received": amount,
+        "timestamp": f"{day}T12:00:00+00:00",
+        "transaction_type": "buy",
+    }
+
+
+TRANSACTIONS = [
+    buy("txn_1", "bond_us_1", 100.0, "2026-01-10"),
+    buy("txn_2", "bond_us_1", 50.0, "2026-03-01"),
+    buy("txn_3", "bond_sg_1", 80.0, "2026-02-15"),
+    buy("txn_4", "bond_us_1", 25.0, "2026-03-01"),
+]
+
+
+def lot_value(txn: dict, on: date) -> float:
+    bond = BONDS[txn["bond_id"]]
+    start = date.fromisoformat(txn["timestamp"][:10])
+    end = date.fromisoformat(bond["maturity_date"])
+    if on < start:
+        return 0.0
+    elapsed = min(max((on - start).days, 0), (end - start).days)
+    return txn["amount"] * (1 + bond["yield_percentage"] / 100 * elapsed / 365)
+
+
+def test_holding_lots_value_like_individual_lots(mock_db):
+    async def scenario():
+        for txn in TRANSACTIONS:
+            await apply_buys(mock_db, [txn])
+        return await get_user_holdings(mock_db, "lots@example.com")
+
+    holdings = asyncio.run(scenario())
+    for today in (date(2026, 10, 17), date(2027, 12, 1)):
+        valuation = value_portfolio(holdings, BONDS, window="30d", today=today)
+        for bond_id in BONDS:
+            expected = sum(lot_value(txn, today) for txn in TRANSACTIONS if txn["bond_id"] == bond_id)
+            assert valuation["holdings"][bond_id] == pytest.approx(expected)
+        assert valuation["history"][-1]["value"] == pytest.approx(valuation["total_value"], abs=0.01)
+
+
+def test_rebuild_reproduces_incremental_lots(mock_db):
+    async def scenario():
+        await apply_buys(mock_db, TRANSACTIONS)
+        incremental = await get_user_holdings(mock_db, "lots@example.com")
+        await mock_db.transactions.insert_many([dict(txn) for txn in TRANSACTIONS])
+        await mock_db.holdings.delete_many({})
+        await rebuild_holdings(mock_db, batch_size=1)
+        return incremental, await get_user_holdings(mock_db, "lots@example.com")
+
+    incremental, rebuilt = asyncio.run(scenario())
+    key = lambda holding: holding["bond_id"]
+    assert sorted(rebuilt, key=key) == sorted(incremental, key=key)
+
+
+def test_history_values_each_lot_from_its_own_purchase_day(mock_db):
+    early = buy("txn_early", "bond_us_1", 100.0, "2026-01-10")
+    late = buy("txn_late", "bond_us_1", 10000.0, "2026-10-01")
+
+    async def scenario():
+        await apply_buys(mock_db, [early])
+        await apply_buys(mock_db, [late])
+        return await get_user_holdings(mock_db, "lots@example.com")
+
+    holdings = asyncio.run(scenario())
+    valuation = value_portfolio(holdings, BONDS, window="inception", max_points=1000, today=date(2026, 10, 17))
+    history = {point["date"]: point["value"] for point in valuation["history"]}
+
+    assert history["2026-01-10"] == pytest.approx(100.0, abs=0.01)
+    for day in ("2026-05-01", "2026-09-30", "2026-10-01", "2026-10-17"):
+        on = date.fromisoformat(day)
+        assert history[day] == pytest.approx(lot_value(early, on) + lot_value(late, on), abs=0.01)
+    assert history["2026-09-30"] < 200
@@ -0,0 +1,54 @@
+import asyncio
+
+import httpx
+
+from idempotency import IdempotencyStore
+from indexes import apply_indexes
+
+
+def test_slow_owner_keeps_its_claim_across_workers(mock_db):
+    calls = []
+
+    async def handler():
+        calls.append(1)
+        # Runs for several lock timeouts; the renewed claim must stop the other worker taking over
+        await asyncio.sleep(0.5)
+        return {"id": "txn_slow"}
+
+    async def scenario():
+        await apply_indexes(mock_db)
+        workers = [IdempotencyStore(lock_timeout=0.15, wait=5.0, poll_interval=0.02) for _ in range(2)]
+
+        async def request(store, delay):
+            await asyncio.sleep(delay)
+            return await store.run(mock_db, "slow@example.com", "key-1", "buy", {"amount": 5}, handler)
+
+        return await asyncio.gather(request(workers[0], 0), request(workers[1], 0.2))
+
+    owner, duplicate = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert owner == (200, {"id": "txn_slow"}, False)
+    assert duplicate == (200, {"id": "txn_slow"}, True)
+
+
+def test_concurrent_same_key_buys_debit_once(api, register):
+    import server
+
+    headers = {**register("same-key@example.com"), "Idempotency-Key": "buy-once"}
+    balance = api.get("/api/wallet", headers=headers).json()["usdc_balance"]
+
+    async def burst():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*[
+                client.post("/api/transactions/buy", json={"bond_id": "bond_us_1", "amount": 10.0}, headers=headers)
+                for _ in range(5)
+            ])
+
+    responses = api.portal.call(burst)
+
+    assert [response.status_code for response in responses] == [200] * 5
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert sum(response.headers.get("Idempotent-Replayed") == "true" for response in responses) == 4
+    assert api.get("/api/wallet", headers=headers).json()["usdc_balance"] == balance - 10.0
+    assert len(api.get("/api/transactions", headers=headers).json()) == 1
@@ -0,0 +1,77 @@
+import asyncio
+
+from indexer import ChainIndexer, FixtureSource, reconcile
+from indexes import apply_indexes
+from settlement import SETTLED
+
+from .conftest import FIXTURES_DIR
+
+CONTRACT = "CJQGUKB22EGIU642NMUVV3F7ZFNPCMGFMQSTQKHBROOPDATRIV4JR3KK"
+CUSTODY = "GIF47ALMTZGSNXTJGARDYXSZ5GE6NAEVALRSGACNNZFXS4DIYZZQA5F7"
+ALICE = "GIIRBEKVRPUFJQQGITE7CC66ZGIT2K546JLMMSHM4Z5ETHNNTNS36GXP"
+BOB = "GLXSJAVYJSIELCHR2FM442CLLG7TKPROHG43VPKD4FBSBQWQTZEXADLK"
+
+# Net of the fixture's mints, transfers, burn and clawback on CONTRACT, in 7-decimal units
+EXPECTED_BALANCES = {
+    CUSTODY: 1_110_000_000,
+    ALICE: 120_000_000,
+    BOB: 65_000_000,
+}
+
+
+async def drain(indexer: ChainIndexer) -> int:
+    total = 0
+    while True:
+        page = await indexer.run_once()
+        total += page
+        if page < indexer.batch_size:
+            return total
+
+
+async def snapshot(db) -> tuple:
+    balances = {
+        row["address"]: (row["balance"], row["through"])
+        async for row in db.chain_balances.find({"contract_id": CONTRACT}, {"_id": 0})
+    }
+    return balances, await db.chain_events.count_documents({})
+
+
+def test_fixture_replay_is_idempotent_and_reconciles(mock_db):
+    async def scenario():
+        await apply_indexes(mock_db)
+        source = FixtureSource(str(FIXTURES_DIR / "bond_token_events.jsonl"))
+        indexer = ChainIndexer(mock_db, source, CONTRACT, batch_size=4)
+
+        results = {"indexed": await drain(indexer), "first": await snapshot(mock_db)}
+        results["replayed"] = await drain(indexer)
+        # A crash before the cursor was saved replays from an earlier event, or from the start
+        events = await mock_db.chain_events.find({}, {"event_id": 1}).sort("event_id", 1).to_list(None)
+        await mock_db.indexer_state.update_one({"_id": CONTRACT}, {"$set": {"cursor": events[2]["event_id"]}})
+        await drain(indexer)
+        results["resumed"] = await snapshot(mock_db)
+        await mock_db.indexer_state.delete_one({"_id": CONTRACT})
+        await drain(indexer)
+        results["reset"] = await snapshot(mock_db)
+
+        await mock_db.users.insert_many([
+            {"email": "alice@example.com", "stellar_address": ALICE},
+            {"email": "bob@example.com", "stellar_address": BOB},
+        ])
+        await mock_db.holdings.insert_many([
+            {"email": "alice@example.com", "bond_id": "bond_us_1", "tokens": 12.0},
+            {"email": "bob@example.com", "bond_id": "bond_us_1", "tokens": 6.5},
+        ])
+        await mock_db.settlements.insert_one(
+            {"txn_id": "txn_custody", "bond_id": "bond_us_1", "units": 1_110_000_000, "status": SETTLED}
+        )
+        results["mismatches"] = await reconcile(mock_db, CONTRACT, ["bond_us_1"], custody_address=CUSTODY)
+        return results
+
+    results = asyncio.run(scenario())
+    balances, event_count = results["first"]
+    assert results["indexed"] == event_count == 10
+    assert {address: balance for address, (balance, _) in balances.items()} == EXPECTED_BALANCES
+    assert results["replayed"] == 0
+    assert results["resumed"] == results["first"]
+    assert results["reset"] == results["first"]
+    assert results["mismatches"] == []
@@ -0,0 +1,36 @@
+import asyncio
+import json
+from argparse import Namespace
+
+import pytest
+
+from manage import cmd_ingest_quotes
+
+LINES = [
+    json.dumps({"bond_id": "bond_us_1", "timestamp": "2026-10-16T10:00:00Z", "yield_percentage": 4.21, "price": 99.5}),
+    json.dumps({"bond_id": "bond_us_1", "timestamp": "2026-10-16T11:00:00Z", "yield_percentage": "high"}),
+    json.dumps({"bond_id": "bond_zz_9", "timestamp": "2026-10-16T10:00:00Z", "yield_percentage": 1.0}),
+    "{not json",
+    json.dumps({"bond_id": "bond_us_1", "timestamp": "2026-10-17T10:00:00Z", "yield_percentage": 4.25}),
+]
+
+
+def test_bad_quote_lines_are_reported_and_skipped(mock_db, tmp_path, capsys):
+    path = tmp_path / "quotes.jsonl"
+    path.write_text("\n".join(LINES) + "\n")
+
+    async def scenario():
+        await mock_db.bonds.insert_one({"id": "bond_us_1"})
+        with pytest.raises(SystemExit) as exited:
+            await cmd_ingest_quotes(mock_db, Namespace(file=str(path), batch_size=2))
+        days = sorted(await mock_db.bond_quotes.distinct("day", {"bond_id": "bond_us_1"}))
+        return exited.value.code, days, await mock_db.bond_quotes.count_documents({"bond_id": "bond_zz_9"})
+
+    code, days, unknown = asyncio.run(scenario())
+    err = capsys.readouterr().err.splitlines()
+    assert code == 1
+    assert days == ["2026-10-16", "2026-10-17"]
+    assert unknown == 0
+    assert [line.split(":")[0] for line in err] == ["line 2", "line 3", "line 4"]
+    assert "yield_percentage" in err[0]
+    assert "Unknown bond bond_zz_9" in err[1]
@@ -0,0 +1,51 @@
+import asyncio
+
+from cache import MemoryStore, ResponseCache
+
+
+def test_miss_does_not_cache_after_concurrent_invalidate():
+    async def scenario():
+        cache = ResponseCache(MemoryStore())
+        cached, generation = await cache.lookup("a@example.com", "portfolio")
+        assert cached is None
+        # A buy settles and invalidates while the miss is still computing
+        await cache.invalidate("a@example.com")
+        await cache.set("a@example.com", "portfolio", {"total": 0}, generation)
+        stale, _ = await cache.lookup("a@example.com", "portfolio")
+        assert stale is None
+
+        _, generation = await cache.lookup("a@example.com", "portfolio")
+        await cache.set("a@example.com", "portfolio", {"total": 100}, generation)
+        fresh, _ = await cache.lookup("a@example.com", "portfolio")
+        assert fresh == {"total": 100}
+
+    asyncio.run(scenario())
+
+
+def test_evicted_generation_still_rejects_stale_set():
+    async def scenario():
+        cache = ResponseCache(MemoryStore(maxsize=2))
+        _, generation = await cache.lookup("a@example.com", "portfolio")
+        await cache.invalidate("a@example.com")
+        for email in ("b@example.com", "c@example.com"):
+            await cache.invalidate(email)
+        await cache.set("a@example.com", "portfolio", {"total": 0}, generation)
+        stale, _ = await cache.lookup("a@example.com", "portfolio")
+        assert stale is None
+
+    asyncio.run(scenario())
+
+
+def test_portfolio_cache_keeps_one_field_per_named_window(api, register):
+    import server
+
+    headers = register("cache-windows@example.com")
+    assert api.get("/api/portfolio?window=30d", headers=headers).headers["X-Cache"] == "MISS"
+    assert api.get("/api/portfolio?window=30d", headers=headers).headers["X-Cache"] == "HIT"
+    for days in range(1, 20):
+        response = api.get(f"/api/portfolio?window={days}d", headers=headers)
+        assert response.status_code == 200
+        assert response.headers["X-Cache"] == "BYPASS"
+
+    entry = server.portfolio_cache.store._entries.get("cache-windows@example.com")
+    assert set(entry) == {"30d"}
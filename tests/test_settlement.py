@@ -0,0 +1,93 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from settlement import SETTLED, SUBMITTED, LocalRpc, SettlementWorker, enqueue
+
+PURCHASES = [
+    {"id": f"txn_settle_{i}", "email": "settle@example.com", "bond_id": "bond_us_1", "amount": 10.0}
+    for i in range(3)
+]
+
+
+class WorkerCrashed(BaseException):
+    pass
+
+
+class CrashAfterSend:
+    """Sends through the chain, then dies before the worker hears back."""
+
+    def __init__(self, chain: LocalRpc):
+        self.chain = chain
+
+    async def submit(self, invocation: dict, before_send=None) -> str:
+        await self.chain.submit(invocation, before_send)
+        raise WorkerCrashed()
+
+
+class LostBeforeSend:
+    """Signs and hands out the hash, then loses the connection before the network sees it."""
+
+    def __init__(self, chain: LocalRpc):
+        self.chain = chain
+
+    async def submit(self, invocation: dict, before_send=None) -> str:
+        await before_send("f" * 64, datetime.now(timezone.utc) + timedelta(seconds=30))
+        raise ConnectionError("connection reset")
+
+    async def confirm(self, tx_hash: str, timeout: float) -> str:
+        return await self.chain.confirm(tx_hash, timeout)
+
+
+def worker(db, rpc, **kwargs) -> SettlementWorker:
+    return SettlementWorker(db, rpc, bond_tokens={"*": "CBONDTOKEN"}, backoff=0.0, **kwargs)
+
+
+async def statuses(db) -> set:
+    return {doc["status"] async for doc in db.settlements.find({}, {"status": 1})}
+
+
+def test_crash_after_submit_is_confirmed_by_hash_not_resubmitted(mock_db):
+    async def scenario():
+        chain = LocalRpc(latency=0.0)
+        await enqueue(mock_db, PURCHASES)
+        try:
+            await worker(mock_db, CrashAfterSend(chain)).run_once()
+        except WorkerCrashed:
+            pass
+        await asyncio.sleep(0.01)
+        await worker(mock_db, chain, lease=0.0, confirm_timeout=0.0).run_once()
+        return chain, await statuses(mock_db)
+
+    chain, seen = asyncio.run(scenario())
+    assert len(chain.invocations) == 1
+    assert seen == {SETTLED}
+
+
+def test_crash_before_signing_is_requeued(mock_db):
+    async def scenario():
+        chain = LocalRpc(latency=0.0)
+        await enqueue(mock_db, PURCHASES)
+        crashed = worker(mock_db, chain)
+        await crashed._claim()
+        await asyncio.sleep(0.01)
+        await worker(mock_db, chain, lease=0.0, confirm_timeout=0.0).run_once()
+        return chain, await statuses(mock_db)
+
+    chain, seen = asyncio.run(scenario())
+    assert len(chain.invocations) == 1
+    assert seen == {SETTLED}
+
+
+def test_unconfirmed_transaction_is_not_resent_before_expiry(mock_db):
+    async def scenario():
+        chain = LocalRpc(latency=0.0)
+        await enqueue(mock_db, PURCHASES)
+        lost = worker(mock_db, LostBeforeSend(chain), confirm_timeout=0.0)
+        await lost.run_once()
+        await asyncio.sleep(0.01)
+        await lost.run_once()
+        return chain, await statuses(mock_db)
+
+    chain, seen = asyncio.run(scenario())
+    assert chain.invocations == []
+    assert seen == {SUBMITTED}